@@ -1,8 +1,4 @@
-import subprocess
-import os
-
-if os.name == 'nt':
-    from win10toast import ToastNotifier
+from midi2control.notify import Notifier
 
 
 """
@@ -10,11 +6,27 @@ System notifications
 
 """
 
-def notify_user(subject, message):
+NOTIFIER = Notifier()
+
+
+def notify_user(subject, message, key=None):
+    """
+    Show a system notification without blocking. A pending notification with the same key is replaced.
+
+    :param subject: (str) Notification title
+    :param message: (str) Notification text
+    :param key: Notifications with the same key replace each other (eg: the device name)
+    :return: None
+    """
     print(subject, message)
-    if os.name == 'nt':
-        ToastNotifier().show_toast(subject, message, duration=5, threaded=True)
-    elif os.name == 'darwin':
-        os.system("""osascript -e 'display notification "{}" with title "{}"'""".format(subject, message))
-    elif os.name == 'posix':
-        subprocess.run(['notify-send', subject, message])
\ No newline at end of file
+    NOTIFIER.notify(subject, message, key=key)
+
+
+def set_notification_backend(backend):
+    """
+    Change the backend used to show notifications, eg: midi2control.notify.NullBackend() for headless use
+
+    :param backend: Notification backend
+    :return: None
+    """
+    NOTIFIER.backend = backend
@@ -0,0 +1,141 @@
+import heapq
+import threading
+import time
+
+"""
+Clocks used for time based behaviour (reconnection, sync phase, animations, timers).
+
+Devices, hubs and outputs take a clock, defaulting to the wall clock CLOCK. A VirtualClock only moves when advanced,
+so tests and benchmarks can simulate hours of controller use in milliseconds:
+
+    clock = VirtualClock()
+    ddj = DDJ_SB(clock=clock)
+    clock.advance(5)  # Runs the 5 second start animation immediately
+
+"""
+
+
+class TimerHandle:
+    def __init__(self, when, func, args):
+        """
+        Scheduled function
+
+        :param when: clock monotonic() time to execute the function
+        :param func: function to execute
+        :param args: un-named arguments of the function
+        """
+        self.when = when
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return self.when < other.when
+
+    def cancel(self):
+        """
+        Prevent the function from being executed
+        :return: None
+        """
+        self.cancelled = True
+
+
+class Clock:
+    """
+    Wall clock
+    """
+    def time(self):
+        """
+        :return: Seconds since the epoch
+        """
+        return time.time()
+
+    def monotonic(self):
+        """
+        :return: Seconds of a clock which never goes backwards, for intervals
+        """
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        """
+        Wait for a number of seconds
+        :return: None
+        """
+        time.sleep(seconds)
+
+    def call_later(self, delay, func, *args):
+        """
+        Execute a function after a delay in a timer thread
+
+        :param delay: Seconds to wait
+        :param func: function to execute
+        :param args: un-named arguments of the function
+        :return: Timer which can be cancelled with cancel()
+        """
+        timer = threading.Timer(delay, func, args)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+
+class VirtualClock(Clock):
+    def __init__(self, start=0.0, epoch=0.0):
+        """
+        Clock which only moves when advanced (or slept). Scheduled functions are executed by advance()
+        in the calling thread, in time order.
+
+        :param start: Initial monotonic() time
+        :param epoch: time() at the initial monotonic() time
+        """
+        self.now = start
+        self.epoch = epoch - start
+        self.timers = list()  # heap of TimerHandle
+        self.lock = threading.Lock()
+
+    def time(self):
+        return self.epoch + self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        """
+        Advance the clock instead of waiting
+        :return: None
+        """
+        self.advance(seconds)
+
+    def call_later(self, delay, func, *args):
+        """
+        Execute a function once the clock has been advanced by delay
+
+        :param delay: Seconds to wait
+        :param func: function to execute
+        :param args: un-named arguments of the function
+        :return: TimerHandle which can be cancelled with cancel()
+        """
+        handle = TimerHandle(self.now + delay, func, args)
+        with self.lock:
+            heapq.heappush(self.timers, handle)
+        return handle
+
+    def advance(self, seconds):
+        """
+        Move the clock forward, executing the scheduled functions which become due at their scheduled time
+
+        :param seconds: Seconds to move forward
+        :return: None
+        """
+        target = self.now + seconds
+        while True:
+            with self.lock:
+                if not self.timers or self.timers[0].when > target:
+                    break
+                handle = heapq.heappop(self.timers)
+            self.now = max(self.now, handle.when)
+            if not handle.cancelled:
+                handle.func(*handle.args)
+        self.now = max(self.now, target)
+
+
+CLOCK = Clock()
@@ -1,8 +1,53 @@
+import importlib
+import logging
+import time
+
 """
 Generic function factory to create a function callable from the Mapping output
 
+Backend libraries of the control outputs are imported lazily, see LazyModule and import_report()
+
 """
 
+_UNSET = object()
+SIMPLE = (str, int, float, type(None))  # Types of the factory arguments shown in the output names
+
+
+def describe(value):
+    """
+    :param value: Argument of an output factory
+    :return: (str) Short description of the value: the repr of simple values, the name of a mapping or the class
+    """
+    if isinstance(value, SIMPLE):
+        return repr(value)
+    name = getattr(value, 'name', None)
+    if isinstance(name, str):
+        return name
+    return getattr(value, '__qualname__', value.__class__.__name__)
+
+
+def output_label(function):
+    """
+    Readable name of a mapping output function: its name attribute if set by the factory (eg: output()), otherwise
+    its module and qualified name, followed by the simple values a closure was created with (the factory arguments)
+
+    :param function: mapping output function
+    :return: (str) eg: "midi2control.control.gui.press.<locals>.func('F1')"
+    """
+    name = getattr(function, 'name', None)
+    if isinstance(name, str):
+        return name
+    name = f'{getattr(function, "__module__", "")}.{getattr(function, "__qualname__", function.__class__.__name__)}'
+    values = list()
+    for cell in getattr(function, '__closure__', None) or ():
+        try:
+            if isinstance(cell.cell_contents, SIMPLE):
+                values.append(repr(cell.cell_contents))
+        except ValueError:  # Cell not assigned yet
+            pass
+    return f'{name}({", ".join(values)})' if values else name
+
+
 def output(function, *args, **kwargs):
     """
     Generic closure to creates a callable function for deferred execution of the function, with the provided arguments
@@ -13,4 +58,106 @@ def output(function, *args, **kwargs):
     :return: mapping output function suitable to pass to device mapping
     """
 
-    return lambda *map_args, **map_kwargs: function(*args, **kwargs)
\ No newline at end of file
+    func = lambda *map_args, **map_kwargs: function(*args, **kwargs)
+    func.name = f'{output_label(function)}(' \
+                f'{", ".join([describe(a) for a in args] + [f"{k}={describe(v)}" for k, v in kwargs.items()])})'
+    return func
+
+
+class Sinks:
+    """
+    Last value emitted to each output target (sink), eg: a mouse pixel position, gamepad axis or light brightness.
+
+    Outputs declare the concrete value they are about to emit and skip the call if it is the value last emitted
+    to the same sink. This removes redundant OS, driver and network calls when inputs are frequent.
+    """
+    def __init__(self):
+        self.values = dict()
+
+    def changed(self, key, value):
+        """
+        Record value as emitted to the sink if it differs from the last emitted value
+
+        :param key: Hashable identifier of the sink, eg: ('mouse', 'x')
+        :param value: Concrete value the output will emit
+        :return: (bool) True if the output should be executed
+        """
+        if self.values.get(key, _UNSET) == value:
+            return False
+        self.values[key] = value
+        return True
+
+    def forget(self, key=None):
+        """
+        Forget the last emitted value, eg: when the target has been reset or reconnected
+
+        :param key: Sink to forget or None for all sinks
+        :return: None
+        """
+        if key is None:
+            self.values.clear()
+        else:
+            self.values.pop(key, None)
+
+
+SINKS = Sinks()
+
+
+def dedupe(function, value=None, sink=None):
+    """
+    Generic closure to only execute a mapping output function when the value it emits has changed
+
+    :param function: mapping output function
+    :param value: function returning the concrete emitted value from the mapping (defaults to mapping.current_state)
+    :param sink: Key of the sink, sharing a key between outputs dedupes across them (defaults to the function)
+    :return: mapping output function suitable to pass to device mapping
+    """
+    value = value or (lambda mapping: mapping.current_state)
+    sink = function if sink is None else sink
+
+    def func(mapping, device=None, msg=None):
+        if SINKS.changed(sink, value(mapping)):
+            return function(mapping, device, msg)
+    func.name = f'dedupe({output_label(function)})'
+    return func
+
+
+IMPORTS = dict()  # Seconds taken to import each backend module, in order of import
+
+
+class LazyModule:
+    """
+    Backend module (eg: pyautogui) imported when one of its attributes is first used, ie: when an output using
+    it is created or called. A process only pays the import time of the backends it actually uses.
+    """
+    def __init__(self, name):
+        """
+        :param name: (str) Module name, eg: 'pyautogui'
+        """
+        self.__name = name
+        self.__module = None
+
+    def __getattr__(self, item):
+        if item.startswith('_LazyModule__'):
+            raise AttributeError(item)
+        if self.__module is None:
+            start = time.perf_counter()
+            module = importlib.import_module(self.__name)
+            IMPORTS[self.__name] = time.perf_counter() - start
+            logging.debug(f'Backend {self.__name} imported in {IMPORTS[self.__name]:.3f} seconds')
+            self.__module = module
+        return getattr(self.__module, item)
+
+    def __repr__(self):
+        return f"<lazy module '{self.__name}' ({'imported' if self.__module else 'not imported'})>"
+
+
+def import_report():
+    """
+    Report of the backends imported so far and their import time, eg: to check the cold start of a deployment
+
+    :return: (str) One line per imported backend
+    """
+    if not IMPORTS:
+        return 'No backends imported'
+    return '\n'.join(f'{name}: {seconds * 1000:.1f} ms' for name, seconds in IMPORTS.items())
@@ -1,22 +1,32 @@
 import logging
-import vgamepad as vg
+from midi2control.control import SINKS, LazyModule
+
+vg = LazyModule('vgamepad')
 
 """
 Gamepad control outputs which can be added as output to a device mapping.
 
 Uses gamepad implementations from the vgamepad library
 
+Outputs skip the driver update if the button or axis value would not change.
+
 """
 
 
-class Gamepad(vg.VX360Gamepad):
+class Gamepad:
     def __init__(self):
         """
         Gamepad class to create gamepad instance using the XBOX-360 model.
+        Other attributes are those of the vgamepad VX360Gamepad, which is only imported when a gamepad is created.
         """
-        super().__init__()
+        self.gamepad = vg.VX360Gamepad()
         logging.debug('Virtual Gamepad created')
 
+    def __getattr__(self, item):
+        if item == 'gamepad':
+            raise AttributeError(item)
+        return getattr(self.gamepad, item)
+
 
 class BUTTONS:
     """
@@ -54,6 +64,8 @@ def button_press(gamepad, button):
     def fun(*args, **kwargs):
         m = args[0]
 
+        if not SINKS.changed((id(gamepad), button), bool(m.current_state)):
+            return
         if m.current_state:
             logging.debug(f'Pressing button with code {button}')
             gamepad.press_button(button)
@@ -76,8 +88,11 @@ def left_joystick_x(gamepad, invert=False):
     def fun(*args, **kwargs):
         m = args[0]
         state = m.current_state if not invert else -m.current_state
+        value = round(state*32767)
+        if not SINKS.changed((id(gamepad), 'left_joystick_x'), value):
+            return
         logging.debug(f'Moving x axes of left joystick to {state}')
-        gamepad.left_joystick(x_value=round(state*32767), y_value=gamepad.report.sThumbLY)
+        gamepad.left_joystick(x_value=value, y_value=gamepad.report.sThumbLY)
         gamepad.update()
 
     return fun
@@ -94,8 +109,11 @@ def left_joystick_y(gamepad, invert=False):
     def fun(*args, **kwargs):
         m = args[0]
         state = m.current_state if not invert else -m.current_state
+        value = round(state*32767)
+        if not SINKS.changed((id(gamepad), 'left_joystick_y'), value):
+            return
         logging.debug(f'Moving y axes of left joystick to {state}')
-        gamepad.left_joystick(x_value=gamepad.report.sThumbLX, y_value=round(state*32767))
+        gamepad.left_joystick(x_value=gamepad.report.sThumbLX, y_value=value)
         gamepad.update()
 
     return fun
@@ -112,8 +130,11 @@ def right_joystick_x(gamepad, invert=False):
     def fun(*args, **kwargs):
         m = args[0]
         state = m.current_state if not invert else -m.current_state
+        value = round(state*32767)
+        if not SINKS.changed((id(gamepad), 'right_joystick_x'), value):
+            return
         logging.debug(f'Moving x axes of right joystick to {state}')
-        gamepad.right_joystick(x_value=round(state*32767), y_value=gamepad.report.sThumbLY)
+        gamepad.right_joystick(x_value=value, y_value=gamepad.report.sThumbLY)
         gamepad.update()
 
     return fun
@@ -130,8 +151,11 @@ def right_joystick_y(gamepad, invert=False):
     def fun(*args, **kwargs):
         m = args[0]
         state = m.current_state if not invert else -m.current_state
+        value = round(state*32767)
+        if not SINKS.changed((id(gamepad), 'right_joystick_y'), value):
+            return
         logging.debug(f'Moving y axes of right joystick to {state}')
-        gamepad.right_joystick(x_value=gamepad.report.sThumbLX, y_value=round(state*32767))
+        gamepad.right_joystick(x_value=gamepad.report.sThumbLX, y_value=value)
         gamepad.update()
 
     return fun
@@ -152,6 +176,9 @@ def left_trigger(gamepad, invert=False):
             state = int(m.current_state) if not invert else -int(m.current_state)
         else:
             state = m.current_state if not invert else -m.current_state
+        # Driver resolution of trigger is 0-255
+        if not SINKS.changed((id(gamepad), 'left_trigger'), round(state*255)):
+            return
         logging.debug(f'Moving left trigger to {state}')
         gamepad.left_trigger_float(state)
         gamepad.update()
@@ -174,6 +201,9 @@ def right_trigger(gamepad, invert=False):
             state = int(m.current_state) if not invert else -int(m.current_state)
         else:
             state = m.current_state if not invert else -m.current_state
+        # Driver resolution of trigger is 0-255
+        if not SINKS.changed((id(gamepad), 'right_trigger'), round(state*255)):
+            return
         logging.debug(f'Moving right trigger to {state}')
         gamepad.right_trigger_float(value_float=state)
         gamepad.update()
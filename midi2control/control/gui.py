@@ -1,5 +1,7 @@
 import logging
-import pyautogui
+from midi2control.control import SINKS, LazyModule
+
+pyautogui = LazyModule('pyautogui')
 
 """
 Mouse and keyboard control outputs which can be added as output to a device mapping
@@ -155,14 +157,14 @@ def move_y(invert=False, scale=800):
 def move_to_x():
     """
     Creates callable function to move the mouse cursor on the x-axes to a point on the screen relative to the screen width.
-    The mapping state should be between 0 (left) and 1.0 (right).
+    The mapping state should be between 0 (left) and 1.0 (right). The move is skipped if the pixel is unchanged.
 
     :return: mapping output function suitable to pass to device mapping
     """
     def func(mapping, device=None, msg=None):
         w, h = pyautogui.size()
-        x, y = mapping.current_state * w, None
-        if 0 < x <= h:
+        x, y = round(mapping.current_state * w), None
+        if 0 < x <= w and SINKS.changed(('mouse', 'x'), x):
             logging.debug(f'Moving mouse to horizontal pixel position {x}')
             pyautogui.moveTo(x, y, _pause=False)
 
@@ -172,18 +174,17 @@ def move_to_x():
 def move_to_y():
     """
     Creates callable function to move the mouse cursor on the y-axes to a point on the screen relative to the screen height.
-    The mapping state should be between 0 (top) and 1.0 (bottom).
+    The mapping state should be between 0 (top) and 1.0 (bottom). The move is skipped if the pixel is unchanged.
 
     :return: mapping output function suitable to pass to device mapping
     """
 
     def func(mapping, device=None, msg=None):
         w, h = pyautogui.size()
-        x, y = None, mapping.current_state * h
-        if 0 < y <= h:
+        x, y = None, round(mapping.current_state * h)
+        if 0 < y <= h and SINKS.changed(('mouse', 'y'), y):
             logging.debug(f'Moving mouse to vertical pixel position {y}')
             pyautogui.moveTo(x, y, _pause=False)
-        pyautogui.moveTo(None, mapping.current_state * h, _pause=False)
 
     return func
 
@@ -1,5 +1,7 @@
 import logging
-from leglight import LegLight, discover
+from midi2control.control import Sinks, LazyModule
+
+leglight = LazyModule('leglight')
 
 """
 Lighting control outputs which can be added as output to a device mapping.
@@ -15,16 +17,18 @@ def get_elgato_display(display_name):
     :param display_name: (str) Elgato display name
     :return: Leglight instance or None if not found
     """
-    for l in discover(2):
+    for l in leglight.discover(2):
         if l.display == display_name:
             return l
 
-class ElgatoLight(LegLight):
+class ElgatoLight:
     """
-    Extended LegLight class with methods that can be used as a callable function for a device mapping.
+    LegLight wrapper with methods that can be used as a callable function for a device mapping.
+    Other attributes are those of the LegLight, leglight is only imported when a light is created.
 
     The color and brightness steps help to reduce the number of requests sent to the light
-    which can be easily overwhelmed when control inputs are frequent
+    which can be easily overwhelmed when control inputs are frequent. Requests repeating the last
+    value sent are skipped.
 
     :param display_name: (str) Elgato display name
     :param address: IP address of light
@@ -36,9 +40,33 @@ class ElgatoLight(LegLight):
             light = get_elgato_display(display_name)
             address = light.address
             port = light.port
-        LegLight.__init__(self, address=address, port=port)
+        self.light = leglight.LegLight(address=address, port=port)
         self.color_step = color_step
         self.brightness_step = brightness_step
+        self.sinks = Sinks()
+
+    def __getattr__(self, item):
+        if item == 'light':
+            raise AttributeError(item)
+        return getattr(self.light, item)
+
+    def __str__(self):
+        return str(self.light)
+
+    def send(self, key, func, *args):
+        """
+        Send a request to the light. If it fails the sink value is forgotten, so a retry sends it again
+
+        :param key: Sink of the request, eg: 'brightness'
+        :param func: LegLight method
+        :param args: un-named arguments of the method
+        :return: None
+        """
+        try:
+            func(*args)
+        except Exception:
+            self.sinks.forget(key)
+            raise
 
     def switch(self, mapping, device=None, msg=None):
         """
@@ -51,10 +79,9 @@ class ElgatoLight(LegLight):
         :param msg: mido message received from the device (unused)
         :return: None
         """
-        if mapping.current_state:
-            self.on()
-        else:
-            self.off()
+        if not self.sinks.changed('power', bool(mapping.current_state)):
+            return
+        self.send('power', self.on if mapping.current_state else self.off)
 
     def set_color(self, mapping, device=None, msg=None):
         """
@@ -69,9 +96,10 @@ class ElgatoLight(LegLight):
         """
 
         # Convert range 0-1 to 2900-7000
-        new_color = 2900 + mapping.current_state * (7000 - 2900)
+        new_color = round(2900 + mapping.current_state * (7000 - 2900))
         if not self.color_step or abs(new_color - self.isTemperature) > self.color_step or new_color in (7000, 2900):
-            self.color(new_color)
+            if self.sinks.changed('color', new_color):
+                self.send('color', self.color, new_color)
         else:
             logging.debug(f'{self} color change {abs(new_color - self.isTemperature)} '
                           f'below step value {self.color_step}, not changed')
@@ -89,9 +117,10 @@ class ElgatoLight(LegLight):
         """
 
         # brightness 0-100
-        new_brightness = 100 * mapping.current_state
+        new_brightness = round(100 * mapping.current_state)
         if not self.brightness_step or abs(new_brightness - self.isBrightness) > self.brightness_step or new_brightness in (0, 100):
-            self.brightness(new_brightness)
+            if self.sinks.changed('brightness', new_brightness):
+                self.send('brightness', self.brightness, new_brightness)
         else:
             logging.debug(f'{self} brightness change {self.isBrightness} > {new_brightness} '
                           f'below step value {self.brightness_step}, not changed')
\ No newline at end of file
@@ -0,0 +1,207 @@
+import logging
+import socket
+import struct
+import threading
+from midi2control.control import Sinks
+
+"""
+Open Sound Control (OSC) outputs which can be added as output to a device mapping, eg: to control audio or lighting
+software.
+
+Each OscTarget keeps one UDP socket open. The address, type tag and padding of each OSC message are encoded once,
+so an output only packs the value. Attached to a device, the messages of the outputs executed during a poll cycle
+are sent together at its end as one OSC bundle, so dozens of faders cost one datagram per cycle:
+
+    mixer = OscTarget('127.0.0.1', 9000).attach(ddj)
+    Slide('CROSSFADER', channel=6, control=[(31, 63)], outputs=[mixer.message('/mixer/crossfader')])
+
+"""
+
+MAX_DATAGRAM = 1400  # Bundles are split to stay below a typical MTU
+BUNDLE = b'#bundle\x00'
+IMMEDIATELY = struct.pack('>Q', 1)  # OSC time tag of bundles executed when received
+SIZE = struct.Struct('>i')
+INT32 = struct.Struct('>i')
+FLOAT32 = struct.Struct('>f')
+
+
+def pad(text):
+    """
+    :param text: (str) OSC string
+    :return: bytes of the string, null terminated and padded to a multiple of 4 bytes
+    """
+    data = text.encode()
+    return data + b'\x00' * (4 - len(data) % 4)
+
+
+def bundles(messages, max_size=MAX_DATAGRAM):
+    """
+    Pack OSC messages into as few datagrams as possible
+
+    :param messages: list of OSC message bytes
+    :param max_size: (int) Maximum bytes of a datagram (a larger message is sent on its own)
+    :return: generator of (datagram bytes, number of messages in it)
+    """
+    if len(messages) == 1:
+        yield messages[0], 1
+        return
+    start = 0
+    while start < len(messages):
+        size = len(BUNDLE) + len(IMMEDIATELY)
+        end = start
+        while end < len(messages) and (end == start or size + SIZE.size + len(messages[end]) <= max_size):
+            size += SIZE.size + len(messages[end])
+            end += 1
+        yield BUNDLE + IMMEDIATELY + b''.join(SIZE.pack(len(m)) + m for m in messages[start:end]), end - start
+        start = end
+
+
+class OscTarget:
+    def __init__(self, host='127.0.0.1', port=9000, max_size=MAX_DATAGRAM):
+        """
+        OSC server (eg: a mixer or lighting console) receiving the messages of mapping outputs, see message()
+
+        :param host: Address of the OSC server
+        :param port: (int) UDP port of the OSC server
+        :param max_size: (int) Maximum bytes of a bundle, larger cycles are sent as several bundles
+        """
+        self.address = (host, port)
+        self.max_size = max_size
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.templates = dict()  # Encoded address and type tag keyed by (address, type tag)
+        self.pending = dict()  # Message of the current poll cycle keyed by address, only the last value is sent
+        self.lock = threading.Lock()
+        self.thread = None  # Thread running the poll cycles of the attached devices
+        self.sinks = Sinks()
+        self.sent = 0  # Datagrams sent
+        self.dropped = 0  # Datagrams not sent
+
+    def __str__(self):
+        return f'OSC {self.address[0]}:{self.address[1]}'
+
+    def template(self, address, tag):
+        """
+        :param address: (str) OSC address, eg: '/mixer/fader/1'
+        :param tag: (str) OSC type tag of the argument: 'f', 'i', 'T' or 'F'
+        :return: bytes of the message without the argument value
+        """
+        key = (address, tag)
+        template = self.templates.get(key)
+        if template is None:
+            template = self.templates[key] = pad(address) + pad(',' + tag)
+        return template
+
+    def encode(self, address, typ, value):
+        """
+        :param address: (str) OSC address
+        :param typ: (str) 'f' float, 'i' integer or 'T' boolean
+        :param value: Argument value
+        :return: OSC message bytes
+        """
+        if typ == 'T':
+            return self.template(address, 'T' if value else 'F')
+        if typ == 'i':
+            return self.template(address, 'i') + INT32.pack(round(value))
+        return self.template(address, 'f') + FLOAT32.pack(value)
+
+    def message(self, address, typ='f', value=None):
+        """
+        Creates a mapping output function sending the mapping state to an OSC address.
+        Messages repeating the last value sent to the address are skipped.
+
+        :param address: (str) OSC address, eg: '/mixer/fader/1'
+        :param typ: (str) OSC type of the value: 'f' float, 'i' integer or 'T' boolean (sent as T or F)
+        :param value: function returning the value from the mapping (defaults to mapping.current_state),
+        eg: lambda mapping: mapping.current_state * 127
+        :return: mapping output function suitable to pass to device mapping
+        """
+        if typ not in ('f', 'i', 'T'):
+            raise ValueError(f'Unsupported OSC type {typ}, use f, i or T')
+        value = value or (lambda mapping: mapping.current_state)
+        for tag in ('T', 'F') if typ == 'T' else (typ, ):
+            self.template(address, tag)  # Compiled ahead of the first message
+
+        def func(mapping, device=None, msg=None):
+            new_value = value(mapping)
+            if new_value is None or not self.sinks.changed(address, new_value):
+                return
+            self.queue(address, self.encode(address, typ, new_value))
+
+        return func
+
+    def queue(self, address, data):
+        """
+        Send a message at the end of the current poll cycle, or immediately if the output was executed
+        outside of a poll cycle (eg: by an output dispatcher thread or before the device is run)
+
+        :param address: (str) OSC address
+        :param data: OSC message bytes
+        :return: None
+        """
+        if threading.current_thread() is not self.thread:
+            self.send((address, ), data)
+            return
+        with self.lock:
+            self.pending[address] = data
+
+    def send(self, addresses, datagram):
+        """
+        :param addresses: tuple of the OSC addresses of the messages (their last value is forgotten on failure)
+        :param datagram: OSC message or bundle bytes
+        :return: None
+        """
+        try:
+            self.socket.sendto(datagram, self.address)
+            self.sent += 1
+        except OSError as e:
+            self.dropped += 1
+            for address in addresses:
+                self.sinks.forget(address)
+            logging.debug(f'{self} message not sent: {e}')
+
+    def flush(self):
+        """
+        Send the messages of the current poll cycle as bundles, called by the attached devices at the end of each cycle
+        :return: None
+        """
+        self.thread = threading.current_thread()
+        if not self.pending:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, dict()
+        addresses = tuple(pending)
+        start = 0
+        for datagram, count in bundles(list(pending.values()), self.max_size):
+            self.send(addresses[start:start + count], datagram)
+            start += count
+
+    def attach(self, device):
+        """
+        Send the messages of the outputs executed during a poll cycle of a device together
+
+        :param device: midi.device Device
+        :return: self to allow method chaining
+        """
+        device.cycle_hooks.append(self.flush)
+        return self
+
+    def detach(self, device):
+        """
+        Send the messages of the outputs immediately
+
+        :param device: midi.device Device
+        :return: None
+        """
+        if self.flush in device.cycle_hooks:
+            device.cycle_hooks.remove(self.flush)
+        self.flush()
+        self.thread = None
+
+    def close(self):
+        """
+        Send the pending messages and close the socket
+        :return: None
+        """
+        self.flush()
+        self.socket.close()
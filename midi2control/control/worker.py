@@ -0,0 +1,278 @@
+import logging
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+
+from midi2control.clock import CLOCK
+from midi2control.metrics import OUTPUT_DROPS
+from midi2control.midi.mapping import MidiMap
+
+"""
+Control outputs running in a separate worker process.
+
+Output libraries such as pyautogui, vgamepad or leglight hold the GIL and can stall for milliseconds. Running them in
+a worker process keeps the MIDI input handling independent of the slowest output, and a crashing output backend
+does not take the input handling down with it.
+
+Mappings in the input process only push compact (mapping id, state, timestamp) records into a lock-free
+single-producer/single-consumer ring buffer in shared memory. The worker process rebuilds the mapping state and
+executes the outputs.
+
+Example use:
+
+    def setup():
+        # Executed in the worker process: create the outputs there
+        from midi2control.control.gui import move_to_x
+        return {'CH FADER:Deck1': [move_to_x()]}
+
+    worker = OutputWorker(setup)
+    worker.bind(ddj.get_map('CH FADER:Deck1'))
+
+n.b: setup must be a module level function as it is passed to the worker process.
+"""
+
+HEADER = struct.Struct('<QQ')  # head (written by input process), tail (written by worker process)
+RECORD = struct.Struct('<IIdd')  # mapping id, state kind, state, timestamp
+
+FLOAT, BOOL, NONE, INT = range(4)
+
+
+def encode(state):
+    """
+    Encode a mapping state as a kind and float value
+
+    :param state: mapping state (True/False/None/int/float)
+    :return: kind, value
+    """
+    if state is None:
+        return NONE, 0.0
+    if isinstance(state, bool):
+        return BOOL, float(state)
+    if isinstance(state, int):
+        return INT, float(state)
+    return FLOAT, state
+
+
+def decode(kind, value):
+    """
+    Decode a mapping state from a kind and float value
+
+    :param kind: (int) state kind
+    :param value: (float) state value
+    :return: mapping state
+    """
+    if kind == BOOL:
+        return bool(value)
+    if kind == NONE:
+        return None
+    if kind == INT:
+        return int(value)
+    return value
+
+
+class RingBuffer:
+    def __init__(self, capacity=4096, name=None):
+        """
+        Fixed size ring buffer of state records in shared memory.
+
+        Only the producer writes the head index and only the consumer writes the tail index, so no lock is needed.
+
+        :param capacity: (int) Maximum number of records waiting to be consumed
+        :param name: Name of existing shared memory to attach to, or None to create it
+        """
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=name is None,
+                                              size=HEADER.size + capacity * RECORD.size)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        if name is None:
+            HEADER.pack_into(self.buf, 0, 0, 0)
+
+    def push(self, mapping_id, state, timestamp):
+        """
+        Append a record. Producer side
+
+        :param mapping_id: (int) Mapping id
+        :param state: mapping state
+        :param timestamp: Time of the state change
+        :return: (bool) False if the buffer is full and the record was dropped
+        """
+        head, tail = HEADER.unpack_from(self.buf, 0)
+        if head - tail >= self.capacity:
+            return False
+        RECORD.pack_into(self.buf, HEADER.size + (head % self.capacity) * RECORD.size,
+                         mapping_id, *encode(state), timestamp)
+        # Publish the record after it is written
+        struct.pack_into('<Q', self.buf, 0, head + 1)
+        return True
+
+    def pop(self):
+        """
+        Remove the oldest record. Consumer side
+
+        :return: mapping id, state, timestamp or None if empty
+        """
+        head, tail = HEADER.unpack_from(self.buf, 0)
+        if head == tail:
+            return None
+        mapping_id, kind, value, timestamp = RECORD.unpack_from(self.buf,
+                                                                HEADER.size + (tail % self.capacity) * RECORD.size)
+        struct.pack_into('<Q', self.buf, 8, tail + 1)
+        return mapping_id, decode(kind, value), timestamp
+
+    def __len__(self):
+        head, tail = HEADER.unpack_from(self.buf, 0)
+        return head - tail
+
+    def close(self, unlink=False):
+        """
+        Detach from the shared memory
+
+        :param unlink: (bool) Also free the shared memory (creator only)
+        :return: None
+        """
+        self.buf.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def serve(ring_name, capacity, setup, names, stop, idle=0.0005):
+    """
+    Worker process main function. Executes the outputs of the records in the ring buffer
+
+    :param ring_name: Name of the ring buffer shared memory
+    :param capacity: (int) Capacity of the ring buffer
+    :param setup: function returning a dict of output function lists keyed by mapping name
+    :param names: multiprocessing Queue of (mapping id, mapping name) registrations
+    :param stop: multiprocessing Event to stop the worker
+    :param idle: Seconds to sleep when there are no records
+    :return: None
+    """
+    ring = RingBuffer(capacity, name=ring_name)
+    outputs = setup()
+    mappings = dict()  # Worker process copy of the mappings, keyed by id
+
+    try:
+        while not stop.is_set():
+            record = ring.pop()
+            if record is None:
+                time.sleep(idle)
+                continue
+            mapping_id, state, timestamp = record
+            while mapping_id not in mappings:
+                registered_id, name = names.get()
+                mappings[registered_id] = MidiMap(name, outputs=outputs.get(name, list()))
+            m = mappings[mapping_id]
+            if m.current_state is None:
+                m.current_state = state  # First record, the previous state is unknown
+            m.set(state)
+            m.timestamp = timestamp
+            for output in m.outputs:
+                try:
+                    output(m)
+                except Exception as e:
+                    logging.exception(f'Output of {m} failed in worker process: {e}')
+    finally:
+        ring.close()
+
+
+class OutputWorker:
+    def __init__(self, setup, capacity=4096, restart=True, check_interval=1, clock=None):
+        """
+        Runs mapping outputs in a worker process fed through a shared memory ring buffer
+
+        :param setup: module level function executed in the worker process,
+        returning a dict of lists of output functions keyed by mapping name
+        :param capacity: (int) Number of records the ring buffer holds before records are dropped
+        :param restart: (bool) Restart the worker process if it has died
+        :param check_interval: Seconds between checks that the worker process is alive
+        :param clock: midi2control.clock Clock of the record timestamps and checks (defaults to the wall clock)
+        """
+        self.setup = setup
+        self.capacity = capacity
+        self.restart = restart
+        self.check_interval = check_interval
+        self.clock = clock or CLOCK
+
+        self.context = multiprocessing.get_context('spawn')
+        self.ring = RingBuffer(capacity)
+        self.ids = dict()  # Mapping id keyed by mapping name
+        self.dropped = 0
+        self.process = None
+        self.names = None
+        self.stop_event = None
+        self.next_check = 0
+
+        self.start()
+
+    def start(self):
+        """
+        Start the worker process
+        :return: None
+        """
+        self.names = self.context.Queue()
+        self.stop_event = self.context.Event()
+        for name, mapping_id in self.ids.items():
+            self.names.put((mapping_id, name))
+        self.process = self.context.Process(target=serve, name='midi2control output worker', daemon=True,
+                                            args=(self.ring.name, self.capacity, self.setup, self.names,
+                                                  self.stop_event))
+        self.process.start()
+        logging.info(f'Output worker process {self.process.pid} started')
+
+    def stop(self, timeout=1):
+        """
+        Stop the worker process and free the ring buffer
+        :param timeout: Seconds to wait for the worker process to finish
+        :return: None
+        """
+        self.stop_event.set()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close(unlink=True)
+
+    def check(self):
+        """
+        Restart the worker process if it has died (and restart is enabled)
+        :return: None
+        """
+        self.next_check = self.clock.monotonic() + self.check_interval
+        if self.restart and not self.process.is_alive():
+            logging.error(f'Output worker process {self.process.pid} died (exit code {self.process.exitcode}), '
+                          f'restarting')
+            self.start()
+
+    def output(self, name):
+        """
+        Creates callable function forwarding the mapping state to the worker process
+
+        :param name: (str) Mapping name the worker process setup provides outputs for
+        :return: mapping output function suitable to pass to device mapping
+        """
+        if name not in self.ids:
+            self.ids[name] = len(self.ids)
+            self.names.put((self.ids[name], name))
+        mapping_id = self.ids[name]
+
+        def func(mapping, device=None, msg=None):
+            if not self.ring.push(mapping_id, mapping.current_state, self.clock.time()):
+                self.dropped += 1
+                OUTPUT_DROPS.labels(mapping.name).inc()
+                logging.warning(f'Output worker buffer full, {mapping} dropped')
+                self.check()
+            elif self.clock.monotonic() > self.next_check:
+                self.check()
+        return func
+
+    def bind(self, mapping, initialise=False):
+        """
+        Add an output to the mapping which forwards its state to the worker process
+
+        :param mapping: midi.mapping MidiMap instance
+        :param initialise: (bool) Whether to trigger the output after adding it
+        :return: mapping to allow method chaining
+        """
+        return mapping.add_output(self.output(mapping.name), initialise=initialise)
@@ -0,0 +1,237 @@
+import logging
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+"""
+Metrics for long running deployments, exposed in the Prometheus text format.
+
+Instruments are created once (eg: per device when it is created), so updating them is an attribute increment
+(and a bisect for histograms), cheap enough to leave on in production. Gauges of queue depths are read when the
+metrics are scraped.
+
+    from midi2control.metrics import serve
+    serve(port=9781)  # http://127.0.0.1:9781/metrics
+
+"""
+
+PORT = 9781  # Default local port of the metrics endpoint
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Counter:
+    __slots__ = ('value', )
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        """
+        Read the value from a function when the metrics are scraped, eg: a queue depth
+
+        :param function: function returning the value
+        :return: None
+        """
+        self.function = function
+
+    def samples(self, name, labels):
+        yield name, labels, self.function() if self.function is not None else self.value
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last count is above the largest bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'), ), self.counts):
+            cumulative += count
+            yield f'{name}_bucket', labels + (('le', '+Inf' if bound == float('inf') else repr(bound)), ), cumulative
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+class Family:
+    def __init__(self, name, help, kind, labelnames=(), factory=Counter):
+        """
+        Metric with one instrument per combination of label values
+
+        :param name: (str) Metric name
+        :param help: (str) Description of the metric
+        :param kind: (str) Prometheus type: counter, gauge or histogram
+        :param labelnames: tuple of label names
+        :param factory: Instrument class
+        """
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.factory = factory
+        self.children = dict()  # Instruments keyed by label values
+        self.lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Instrument of the label values, created on first use. Keep the instrument to update it on hot paths
+
+        :param values: Label values in the order of the label names
+        :return: Counter, Gauge or Histogram
+        """
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.factory())
+        return child
+
+    def render(self):
+        """
+        :return: list of lines in the Prometheus text format
+        """
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for values, child in list(self.children.items()):
+            for name, labels, value in child.samples(self.name, tuple(zip(self.labelnames, values))):
+                label_text = ','.join(f'{k}="{escape(v)}"' for k, v in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.families = dict()
+
+    def family(self, name, help, kind, labelnames, factory):
+        if name not in self.families:
+            self.families[name] = Family(name, help, kind, labelnames, factory)
+        return self.families[name]
+
+    def counter(self, name, help, labelnames=()):
+        return self.family(name, help, 'counter', labelnames, Counter)
+
+    def gauge(self, name, help, labelnames=()):
+        return self.family(name, help, 'gauge', labelnames, Gauge)
+
+    def histogram(self, name, help, labelnames=()):
+        return self.family(name, help, 'histogram', labelnames, Histogram)
+
+    def render(self):
+        """
+        :return: (str) All metrics in the Prometheus text format
+        """
+        lines = list()
+        for family in list(self.families.values()):
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+MESSAGES = REGISTRY.counter('midi2control_messages_total', 'MIDI messages dispatched to the mappings', ('device', ))
+FILTERED = REGISTRY.counter('midi2control_filtered_messages_total',
+                            'MIDI messages discarded as no mapping of the mode listens to them', ('device', ))
+DISPATCH_SECONDS = REGISTRY.histogram('midi2control_dispatch_seconds',
+                                      'Time to handle a batch of received messages, including inline outputs',
+                                      ('device', ))
+CONNECTIONS = REGISTRY.counter('midi2control_connections_total', 'Device connections, including reconnections',
+                               ('device', ))
+OUTPUT_ERRORS = REGISTRY.counter('midi2control_output_errors_total', 'Output functions which raised an exception',
+                                 ('device', ))
+QUEUE_DEPTH = REGISTRY.gauge('midi2control_output_queue_depth', 'States queued in an output dispatcher',
+                             ('dispatcher', ))
+OUTPUT_DROPS = REGISTRY.counter('midi2control_output_drops_total',
+                                'States dropped or replaced by output dispatchers and workers', ('mapping', ))
+BREAKER_OPEN = REGISTRY.gauge('midi2control_output_breaker_open',
+                              'Whether the circuit breaker of an output is open (output skipped)', ('output', ))
+BREAKER_TRIPS = REGISTRY.counter('midi2control_output_breaker_trips_total',
+                                 'Times the circuit breaker of an output opened', ('output', ))
+STATE_LOG_DROPS = REGISTRY.counter('midi2control_state_log_drops_total',
+                                   'Mapping states not recorded as the state log buffer was full', ('log', ))
+
+
+class DeviceMetrics:
+    __slots__ = ('messages', 'filtered', 'dispatch_seconds', 'connections', 'output_errors')
+
+    def __init__(self, name):
+        """
+        Instruments of a device
+
+        :param name: (str) Device name
+        """
+        self.messages = MESSAGES.labels(name)
+        self.filtered = FILTERED.labels(name)
+        self.dispatch_seconds = DISPATCH_SECONDS.labels(name)
+        self.connections = CONNECTIONS.labels(name)
+        self.output_errors = OUTPUT_ERRORS.labels(name)
+
+
+def output_error(device):
+    """
+    Count an output which raised an exception
+
+    :param device: midi.device Device associated with the mapping, or None
+    :return: None
+    """
+    stats = getattr(device, 'stats', None)
+    (stats.output_errors if stats is not None else OUTPUT_ERRORS.labels('')).inc()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f'Metrics request: {format % args}')
+
+
+def serve(host='127.0.0.1', port=PORT):
+    """
+    Serve the metrics over HTTP in a background thread
+
+    :param host: Address to listen on (local only by default)
+    :param port: (int) Port to listen on
+    :return: http.server ThreadingHTTPServer (stop it with shutdown())
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logging.info(f'Metrics served on http://{host}:{port}/metrics')
+    return server
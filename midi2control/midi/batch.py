@@ -0,0 +1,191 @@
+import logging
+from itertools import islice
+from operator import itemgetter
+import mido
+
+from midi2control.midi.message import RawMessage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+"""
+Offline processing of recorded MIDI (eg: .mid files) into a timeline of mapping states, without a live port.
+
+Messages are read and processed as a generator pipeline in blocks, so files of any length are processed in constant
+memory. Each timeline entry is (time, mode, mapping name, state) for every state a mapping output, in the order
+of the messages.
+
+    device = DDJ_SB(ports=(MemoryPort(), MemoryPort()))
+    for time, mode, name, state in device.process_batch(read_midi_file('set.mid')):
+        ...
+
+Without outputs (the default) the states of mappings which support it (eg: jog dials and faders) are calculated for
+a whole block at once with numpy, if it is installed. Other mappings, and all mappings if numpy is not installed,
+handle each message as when the device is live.
+
+"""
+
+BLOCK = 65536  # Messages processed together
+
+
+def read_midi_file(path):
+    """
+    Channel messages of a MIDI file with their time
+
+    :param path: Path of a .mid file
+    :return: generator of (seconds from the start of the file, mido message)
+    """
+    seconds = 0.0
+    for msg in mido.MidiFile(path):  # Merged tracks with the time since the previous message in seconds
+        seconds += msg.time
+        if not msg.is_meta and msg.type != 'sysex':
+            yield seconds, msg
+
+
+def raw_messages(events):
+    """
+    :param events: iterable of (time, message), the message as bytes or a mido or midi.message RawMessage
+    :return: generator of (time, midi.message RawMessage)
+    """
+    for time, msg in events:
+        if isinstance(msg, RawMessage):
+            yield time, msg
+        else:
+            yield time, RawMessage(bytes(msg) if isinstance(msg, (bytes, bytearray)) else bytes(msg.bytes()))
+
+
+def blocks(events, size=BLOCK):
+    """
+    :param events: iterable of (time, message)
+    :param size: (int) Maximum number of messages per block
+    :return: generator of lists of (time, message)
+    """
+    events = iter(events)
+    while True:
+        block = list(islice(events, size))
+        if not block:
+            return
+        yield block
+
+
+class Recorder:
+    def __init__(self, entries, outputs=False):
+        """
+        Stand-in for the output dispatcher of a device, recording the state of each mapping output
+        as a timeline entry instead of (or as well as) executing the output functions
+
+        :param entries: list the entries (index of the message in the block, time, mode, name, state) are added to
+        :param outputs: (bool) Also execute the output functions
+        """
+        self.entries = entries
+        self.outputs = outputs
+        self.index = 0  # Index and time of the message being handled
+        self.time = 0.0
+
+    def submit(self, mapping, device=None, msg=None):
+        self.entries.append((self.index, self.time, device.mode, mapping.name, mapping.current_state))
+        if self.outputs:
+            mapping.execute(mapping, device, msg)
+
+
+def process_scalar(device, block, recorder):
+    """
+    Dispatch each message of a block to the mappings, as when the device is live
+
+    :param device: midi.device Device
+    :param block: list of (time, midi.message RawMessage)
+    :param recorder: Recorder set as the device dispatcher
+    :return: None
+    """
+    for index, (time, msg) in enumerate(block):
+        recorder.index = index
+        recorder.time = time
+        device.dispatch(msg)
+
+
+def process_vectorised(device, block, recorder):
+    """
+    Calculate the states of the mappings of a block, using the batch_states() of the mappings which have it.
+    Only valid without outputs, as the mode (and so the routing of messages) can not change within the block.
+
+    :param device: midi.device Device
+    :param block: list of (time, midi.message RawMessage)
+    :param recorder: Recorder set as the device dispatcher
+    :return: None
+    """
+    if device.pending_reload is not None:
+        device.apply_reload()
+    routes = device.input_filter.routes
+    frames = b''.join(bytes(msg.data[:3]).ljust(3, b'\x00') for _, msg in block)
+    data = numpy.frombuffer(frames, dtype=numpy.uint8).reshape(-1, 3)  # Status and data bytes of each message
+    keys = (data[:, 0].astype(numpy.int64) << 7) | data[:, 1]
+    indices = dict()  # numpy array of message indices keyed by mapping
+    for key in numpy.unique(keys).tolist():
+        if key not in routes:
+            continue
+        found = numpy.flatnonzero(keys == key)
+        for m in routes[key]:
+            indices[m] = numpy.concatenate((indices[m], found)) if m in indices else found
+
+    scalar = set()  # Mappings handling the messages one by one
+    mode = device.mode
+    for m, found in indices.items():
+        found.sort()
+        batch_states = getattr(m, 'batch_states', None)
+        result = batch_states(data[found, 1], data[found, 2]) if batch_states is not None else None
+        if result is None:
+            scalar.add(m)
+            continue
+        emitted, states = result
+        emitted = found[emitted]
+        times = [block[index][0] for index in emitted.tolist()]
+        recorder.entries.extend(zip(emitted.tolist(), times, (mode, ) * len(times), (m.name, ) * len(times),
+                                    states.tolist()))
+
+    if scalar:
+        for index in numpy.unique(numpy.concatenate([indices[m] for m in scalar])).tolist():
+            recorder.index = index
+            recorder.time, msg = block[index]
+            for m in routes[int(keys[index])]:
+                if m in scalar:
+                    m.message(device, msg)
+    device.stats.messages.inc(len(block))
+
+
+def process(device, events, outputs=False, vectorise=True, size=BLOCK):
+    """
+    Process recorded messages into a timeline of mapping states, see Device.process_batch()
+
+    :param device: midi.device Device
+    :param events: iterable of (time, message), the message as bytes or a mido or midi.message RawMessage
+    :param outputs: (bool) Also execute the output functions of the mappings (eg: mode changes)
+    :param vectorise: (bool) Calculate the states with numpy where possible (only without outputs)
+    :param size: (int) Messages processed together
+    :return: generator of (time, mode, mapping name, state)
+    """
+    if device.syncing:
+        device.syncing = False
+        device.absorbed = dict()
+        device.ready.set()
+    if vectorise and not outputs and numpy is None:
+        logging.debug('numpy is not installed, processing messages one by one')
+    vectorise = vectorise and not outputs and numpy is not None
+    entries = list()
+    recorder = Recorder(entries, outputs)
+    for block in blocks(raw_messages(events), size):
+        # The live hooks (state log, bridge, OSC bundles etc) must not see the recorded states
+        live = device.dispatcher, device.state_log, device.bridge, device.cycle_hooks
+        device.dispatcher, device.state_log, device.bridge, device.cycle_hooks = recorder, None, None, list()
+        try:
+            if vectorise:
+                process_vectorised(device, block, recorder)
+                entries.sort(key=itemgetter(0))  # Stable, so the entries of each message stay in order
+            else:
+                process_scalar(device, block, recorder)
+        finally:
+            device.dispatcher, device.state_log, device.bridge, device.cycle_hooks = live
+        for entry in entries:
+            yield entry[1:]
+        entries.clear()
@@ -0,0 +1,186 @@
+import inspect
+import logging
+import threading
+import weakref
+
+from midi2control.clock import CLOCK
+from midi2control.control import output_label
+from midi2control.metrics import BREAKER_OPEN, BREAKER_TRIPS, output_error
+
+"""
+Circuit breakers isolating failing outputs.
+
+An output raising an exception (eg: an unreachable light) no longer stops the input handling. After `threshold`
+consecutive failures its breaker opens and the output is skipped, so a flapping output does not add its timeout to
+every message. After the backoff the output is retried once off the hot path (a timer thread with the wall clock)
+with the latest state of its mapping: the breaker closes if it succeeds, otherwise it stays open for twice as long
+(up to max_backoff).
+
+"""
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_names = weakref.WeakKeyDictionary()  # Name of each output keyed by output function, see output_name()
+_fixed = dict()  # Names of the outputs which cannot be weakly referenced
+_numbers = dict()  # set of the numbers of the live outputs keyed by label
+_names_lock = threading.RLock()  # Reentrant: an output may be collected (see _release()) while naming another
+
+
+def _release(label, number):
+    """
+    Free the number of a collected output, so that the outputs replacing it (eg: on reload) take its name again
+
+    :param label: (str) output_label() of the output
+    :param number: (int) Number of the output among the outputs with this label
+    :return: None
+    """
+    with _names_lock:
+        numbers = _numbers.get(label, ())
+        if number in numbers:
+            numbers.discard(number)
+            if not numbers:
+                del _numbers[label]
+
+
+def output_name(output):
+    """
+    Name of an output in the metrics and profiles, unique among the live outputs: outputs which are alike (eg: created
+    by the same factory with the same arguments) are numbered with the lowest free number, eg:
+    'midi2control.control.gui.press.<locals>.func('F1')#2'
+
+    :param output: mapping output function
+    :return: (str) Readable name of the output, eg: 'midi2control.control.light.ElgatoLight.set_brightness'
+    """
+    with _names_lock:
+        try:
+            name = _names.get(output)
+            names = _names
+        except TypeError:  # Not weakly referenceable
+            name = _fixed.get(output)
+            names = _fixed
+        if name is None:
+            label = output_label(output)
+            numbers = _numbers.setdefault(label, set())
+            number = 1
+            while number in numbers:
+                number += 1
+            numbers.add(number)
+            name = names[output] = label if number == 1 else f'{label}#{number}'
+            if names is _names:
+                weakref.finalize(output, _release, label, number)
+        return name
+
+
+class CircuitBreaker:
+    def __init__(self, output, breakers):
+        """
+        Breaker of an output function
+
+        :param output: mapping output function
+        :param breakers: Breakers the breaker belongs to (configuration and clock)
+        """
+        self.output = output
+        self.breakers = breakers
+        self.name = output_name(output)
+        self.state = CLOSED
+        self.failures = 0  # Consecutive failures
+        self.backoff = breakers.backoff
+        self.last = None  # (mapping, device, msg) of the last call, used to probe the output
+        self.gauge = BREAKER_OPEN.labels(self.name)
+
+    def failure(self, error, mapping, device=None, msg=None):
+        """
+        Record a failed call, opening the breaker once the threshold is reached
+
+        :param error: Exception raised by the output
+        :param mapping: Object passed to the output as mapping
+        :param device: midi.device Device associated with the mapping
+        :param msg: mido message received from the device
+        :return: None
+        """
+        self.failures += 1
+        self.last = (getattr(mapping, 'mapping', mapping), device, msg)  # Probe with the live mapping state
+        if self.state == HALF_OPEN or self.failures >= self.breakers.threshold:
+            if self.state == HALF_OPEN:
+                self.backoff = min(self.backoff * 2, self.breakers.max_backoff)
+            self.state = OPEN
+            self.gauge.set(1)
+            BREAKER_TRIPS.labels(self.name).inc()
+            logging.error(f'Output {self.name} failed {self.failures} times ({error!r}), '
+                          f'skipped for {self.backoff} seconds')
+            self.breakers.clock.call_later(self.backoff, self.probe)
+        else:
+            logging.warning(f'Output {self.name} failed: {error!r}')
+
+    def success(self):
+        """
+        Record a successful call, closing the breaker
+        :return: None
+        """
+        if self.state != CLOSED:
+            logging.info(f'Output {self.name} recovered')
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = self.breakers.backoff
+        self.gauge.set(0)
+
+    def probe(self):
+        """
+        Retry the output once with the latest state of its mapping (half open)
+        :return: None
+        """
+        from midi2control.midi.mapping import run_awaitable
+        self.state = HALF_OPEN
+        mapping, device, msg = self.last
+        try:
+            result = self.output(mapping, device, msg)
+        except Exception as e:
+            output_error(device)
+            self.failure(e, mapping, device, msg)
+        else:
+            if inspect.isawaitable(result):
+                run_awaitable(result, device, self.output, mapping, msg)  # Recorded once completed
+            else:
+                self.success()
+
+
+class Breakers:
+    def __init__(self, threshold=3, backoff=5, max_backoff=300, clock=None):
+        """
+        Circuit breakers of the outputs of a device, created on the first failure of each output
+
+        :param threshold: (int) Consecutive failures which open a breaker
+        :param backoff: Seconds an output is skipped before it is retried
+        :param max_backoff: Maximum seconds an output is skipped when retries keep failing
+        :param clock: midi2control.clock Clock of the retries (defaults to the wall clock)
+        """
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock or CLOCK
+        self.breakers = dict()  # CircuitBreaker keyed by output function
+
+    def get(self, output):
+        """
+        :param output: mapping output function
+        :return: CircuitBreaker of the output or None if it never failed
+        """
+        return self.breakers.get(output)
+
+    def failure(self, output, error, mapping, device=None, msg=None):
+        """
+        Record a failed call of an output
+
+        :param output: mapping output function
+        :param error: Exception raised by the output
+        :param mapping: Object passed to the output as mapping
+        :param device: midi.device Device associated with the mapping
+        :param msg: mido message received from the device
+        :return: None
+        """
+        breaker = self.breakers.get(output)
+        if breaker is None:
+            breaker = self.breakers[output] = CircuitBreaker(output, self)
+        breaker.failure(error, mapping, device, msg)
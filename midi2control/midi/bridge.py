@@ -0,0 +1,508 @@
+import errno
+import logging
+import os
+import select
+import socket
+import struct
+
+from midi2control.clock import CLOCK
+from midi2control.metrics import DeviceMetrics
+from midi2control.midi.breaker import Breakers
+from midi2control.midi.mapping import MidiMap
+
+"""
+Network bridge forwarding mapping states to outputs on another machine.
+
+On the machine with the controller a BridgeSender is attached to the device. The states output by its mappings are
+encoded as they happen and sent together at the end of each poll cycle: one frame (UDP datagram or TCP message)
+holding all events of the cycle, with a sequence number.
+
+    BridgeSender('192.168.1.20', 7782).attach(ddj)
+    ddj.monitor_inputs()
+
+On the other machine a BridgeDevice receives the frames and passes each state to the Remote mapping of the same name,
+which executes its outputs like the mappings of a device (dispatcher, circuit breakers, profiler and state log).
+
+    bridge = BridgeDevice('DDJ-SB', port=7782)
+    bridge.add_map(Remote('CROSSFADER', outputs=[lambda mapping, device, msg: print(mapping.current_state)]))
+    bridge.monitor_inputs()
+
+Frame: header (magic, version, session, sequence number, number of events) followed by the events, each the mode and
+mapping name (length prefixed UTF-8, mode length 0 for the default mode) and the state (type tag and value). Over TCP
+each frame is prefixed with its length. Receivers discard duplicated and late UDP frames and count the lost ones, the
+sequence restarts when a frame of a new session (a restarted sender) arrives. A truncated or garbled frame is
+discarded as a whole (and counted), none of its states are applied.
+
+"""
+
+PORT = 7782  # Default port of the bridge
+MAGIC = b'M2'
+VERSION = 2
+HEADER = struct.Struct('>2sBIIH')  # Magic, version, session, sequence number, number of events
+LENGTH = struct.Struct('>I')  # Length prefix of TCP frames
+MAX_DATAGRAM = 1400  # Frames are split to stay below a typical MTU
+SEQUENCE = 1 << 32
+
+NONE, FALSE, TRUE, INTEGER, FLOAT = range(5)  # State type tags
+INT64 = struct.Struct('>q')
+FLOAT64 = struct.Struct('>d')
+
+
+def encode_text(text):
+    """
+    :param text: (str) Mode or mapping name
+    :return: bytes of the length prefixed UTF-8 text, truncated to 255 bytes without splitting a character
+    """
+    data = text.encode()
+    if len(data) > 255:
+        data = data[:255].decode(errors='ignore').encode()
+    return bytes((len(data), )) + data
+
+
+def encode_state(state):
+    """
+    :param state: Mapping state: None, bool, int or float (others are sent as float)
+    :return: bytes of the type tag and value
+    """
+    if state is None:
+        return bytes((NONE, ))
+    if state is True or state is False:
+        return bytes((TRUE if state else FALSE, ))
+    if isinstance(state, int) and -(1 << 63) <= state < 1 << 63:
+        return bytes((INTEGER, )) + INT64.pack(state)
+    return bytes((FLOAT, )) + FLOAT64.pack(float(state))
+
+
+def decode_text(data, offset):
+    """
+    :param data: Frame bytes
+    :param offset: (int) Position of the length prefix
+    :return: (text, position after the text), raises ValueError if the frame ends before the text
+    """
+    if offset >= len(data) or offset + 1 + data[offset] > len(data):
+        raise ValueError('truncated text')
+    end = offset + 1 + data[offset]
+    return data[offset + 1:end].decode(), end
+
+
+def decode_events(data, count, offset=HEADER.size):
+    """
+    Decode all events of a frame, so that a truncated or garbled frame is rejected before any state is applied
+
+    :param data: Frame bytes
+    :param count: (int) Number of events in the frame
+    :param offset: (int) Position of the first event
+    :return: list of (mode, mapping name, state), raises ValueError if the frame is invalid
+    """
+    events = list()
+    for _ in range(count):
+        mode, offset = decode_text(data, offset)
+        name, offset = decode_text(data, offset)
+        if offset >= len(data):
+            raise ValueError('truncated state')
+        tag = data[offset]
+        offset += 1
+        if tag == INTEGER:
+            state = INT64.unpack_from(data, offset)[0]
+            offset += INT64.size
+        elif tag == FLOAT:
+            state = FLOAT64.unpack_from(data, offset)[0]
+            offset += FLOAT64.size
+        elif tag in (NONE, FALSE, TRUE):
+            state = None if tag == NONE else tag == TRUE
+        else:
+            raise ValueError(f'unknown state type {tag}')
+        events.append((mode or None, name, state))
+    if offset != len(data):
+        raise ValueError(f'{len(data) - offset} bytes after the events')
+    return events
+
+
+class BridgeSender:
+    def __init__(self, host, port=PORT, protocol='udp', max_size=MAX_DATAGRAM, retry=5, clock=None):
+        """
+        Forwards the states output by the mappings of a device to a BridgeDevice, see attach()
+
+        :param host: Address of the receiving machine
+        :param port: (int) Port of the BridgeDevice
+        :param protocol: (str) 'udp' (states lost in the network are not resent) or 'tcp'
+        :param max_size: (int) Maximum bytes of a frame, larger cycles are sent as several frames
+        :param retry: Seconds between TCP connection attempts, states are dropped while not connected (or while the
+        send buffer is full)
+        :param clock: midi2control.clock Clock of the connection retries (defaults to the wall clock)
+        """
+        self.address = (host, port)
+        self.protocol = protocol
+        self.max_size = max_size
+        self.retry = retry
+        self.clock = clock or CLOCK
+        self.session = int.from_bytes(os.urandom(4), 'big')  # Random id, so receivers notice a restarted sender
+        self.sequence = 0
+        self.events = list()  # Encoded events of the current cycle
+        self.names = dict()  # Encoded name keyed by name
+        self.socket = None
+        self.connected = False  # TCP connection established, connect() does not wait for it
+        self.unsent = b''  # Rest of a TCP frame partially sent, sent before the next frame
+        self.next_connect = 0
+        self.sent = 0  # Frames sent
+        self.dropped = 0  # Frames not sent
+        if protocol == 'udp':
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.setblocking(False)
+        elif protocol != 'tcp':
+            raise ValueError(f'Unknown bridge protocol {protocol}, use udp or tcp')
+
+    def encoded(self, name):
+        data = self.names.get(name)
+        if data is None:
+            data = self.names[name] = encode_text(name) if name is not None else b'\x00'
+        return data
+
+    def send(self, mapping, device=None):
+        """
+        Add the current state of a mapping to the frame of the current cycle
+
+        :param mapping: midi.mapping MidiMap instance
+        :param device: midi.device Device associated with the mapping
+        :return: None
+        """
+        self.events.append(self.encoded(getattr(device, 'mode', None)) + self.encoded(mapping.name)
+                           + encode_state(mapping.current_state))
+
+    def attach(self, device):
+        """
+        Forward the states output by the mappings of a device
+
+        :param device: midi.device Device
+        :return: self to allow method chaining
+        """
+        device.bridge = self
+        device.cycle_hooks.append(self.flush)
+        return self
+
+    def detach(self, device):
+        """
+        Stop forwarding a device
+
+        :param device: midi.device Device
+        :return: None
+        """
+        device.bridge = None
+        if self.flush in device.cycle_hooks:
+            device.cycle_hooks.remove(self.flush)
+
+    def frames(self):
+        """
+        Pack the events of the current cycle into frames
+        :return: generator of frame bytes
+        """
+        events, self.events = self.events, list()
+        start = 0
+        while start < len(events):
+            size = HEADER.size
+            end = start
+            while end < len(events) and (end == start or size + len(events[end]) <= self.max_size):
+                size += len(events[end])
+                end += 1
+            yield HEADER.pack(MAGIC, VERSION, self.session, self.sequence, end - start) + b''.join(events[start:end])
+            self.sequence = (self.sequence + 1) % SEQUENCE
+            start = end
+
+    def connect(self):
+        """
+        Connect to the receiver (TCP) without blocking, a new attempt at most once every retry seconds
+        :return: (bool) True if connected
+        """
+        if self.connected:
+            return True
+        now = self.clock.monotonic()
+        if self.socket is None:
+            if now < self.next_connect:
+                return False
+            self.next_connect = now + self.retry
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setblocking(False)
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            error = self.socket.connect_ex(self.address)
+            if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                self.disconnect(os.strerror(error))
+                return False
+        _, writable, _ = select.select([], [self.socket], [], 0)
+        if not writable:
+            if now >= self.next_connect:
+                self.disconnect('timed out')
+            return False  # Still connecting
+        error = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self.disconnect(os.strerror(error))
+            return False
+        self.connected = True
+        logging.info(f'Bridge connected to {self.address[0]}:{self.address[1]}')
+        return True
+
+    def disconnect(self, reason):
+        logging.warning(f'Bridge connection to {self.address[0]}:{self.address[1]} failed: {reason}')
+        self.socket.close()
+        self.socket = None
+        self.connected = False
+        self.unsent = b''
+
+    def write(self, data):
+        """
+        Send a TCP frame without blocking, the rest of a partially sent frame is sent first
+
+        :param data: Length prefixed frame bytes
+        :return: (bool) True if sent, False if dropped because the send buffer is full
+        """
+        try:
+            if self.unsent:
+                self.unsent = self.unsent[self.socket.send(self.unsent):]
+                if self.unsent:
+                    return False
+            sent = self.socket.send(data)
+        except BlockingIOError:
+            return False
+        self.unsent = data[sent:]
+        return True
+
+    def flush(self):
+        """
+        Send the events of the current cycle, called by the device at the end of each poll cycle
+        :return: None
+        """
+        if not self.events:
+            return
+        for frame in self.frames():
+            try:
+                if self.protocol == 'udp':
+                    self.socket.sendto(frame, self.address)
+                elif not self.connect() or not self.write(LENGTH.pack(len(frame)) + frame):
+                    self.dropped += 1
+                    continue
+                self.sent += 1
+            except OSError as e:
+                self.dropped += 1
+                logging.debug(f'Bridge frame {HEADER.unpack_from(frame)[3]} not sent: {e}')
+                if self.protocol == 'tcp':
+                    self.disconnect(e)
+
+    def close(self):
+        """
+        Send the remaining events and close the socket
+        :return: None
+        """
+        self.flush()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            self.connected = False
+
+
+class Remote(MidiMap):
+
+    def __init__(self, name, outputs=None, description=None, initial_state=None):
+        """
+        Mapping of a BridgeDevice, taking the states of the mapping of the same name on the sending device
+
+        :param name: (str) Name of the mapping on the sending device
+        :param outputs: List of mapping output functions which should be executed on mapping input
+        :param description: (str) Detailed description of the mapping
+        :param initial_state: State until the first state is received
+        """
+        super().__init__(name=name, outputs=outputs, description=description, initial_state=initial_state)
+
+    def receive(self, device, state):
+        """
+        Handle a state received from the sending device
+
+        :param device: BridgeDevice associated with this mapping
+        :param state: Received state
+        :return: None
+        """
+        self.set(state)
+        self.output(device)
+
+
+class BridgeDevice:
+    def __init__(self, name, host='0.0.0.0', port=PORT, protocol='udp', midi_maps=None, clock=None):
+        """
+        Receives the states forwarded by a BridgeSender. Like a midi.device Device, it has mappings (Remote)
+        keyed by mode whose outputs are executed when their state is received
+
+        :param name: (str) Name of the device
+        :param host: Address to listen on
+        :param port: (int) Port to listen on
+        :param protocol: (str) 'udp' or 'tcp', as the sender
+        :param midi_maps: Dict of Lists of Remote instances (keyed by mode name), mappings of the default mode (None)
+        also take the states of mappings of the same name in other modes
+        :param clock: midi2control.clock Clock of the circuit breaker retries (defaults to the wall clock)
+        """
+        self.name = name
+        self.protocol = protocol
+        self.clock = clock or CLOCK
+        self.mode = None  # Mode of the state being handled
+        self.midi_maps = dict()
+        self.syncing = False
+        self.dispatcher = None  # midi.dispatcher OutputDispatcher executing outputs in the background, or None inline
+        self.profiler = None  # midi2control.profiler Profiler of the mappings and outputs, or None
+        self.state_log = None  # midi2control.timeseries StateLog recording the mapping states, or None
+        self.bridge = None  # BridgeSender forwarding the states further, or None
+        self.cycle_hooks = list()  # Functions called after the received frames were handled, see end_cycle()
+        self.stats = DeviceMetrics(name)
+        self.breakers = Breakers(clock=self.clock)
+
+        self.session = None  # Session of the sender, the sequence restarts with a new session
+        self.sequence = None  # Sequence number of the last frame received
+        self.received = 0  # Frames received
+        self.lost = 0  # Frames missing from the sequence (UDP)
+        self.late = 0  # Duplicated or out of order frames discarded (UDP)
+        self.unknown = 0  # States received for mappings which are not configured
+        self.invalid = 0  # Truncated or garbled frames discarded
+
+        self.connections = dict()  # Received bytes keyed by TCP connection socket
+        if protocol == 'udp':
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket.bind((host, port))
+        elif protocol == 'tcp':
+            self.socket = socket.create_server((host, port))
+        else:
+            raise ValueError(f'Unknown bridge protocol {protocol}, use udp or tcp')
+        self.socket.setblocking(False)
+        self.address = self.socket.getsockname()
+        logging.info(f'Bridge {self} listening on {self.address[0]}:{self.address[1]} ({protocol})')
+
+        if midi_maps:
+            self.add_maps(midi_maps)
+
+    def __str__(self):
+        return f'{self.name} [bridge]'
+
+    def add_maps(self, midi_maps):
+        for mode, maps in midi_maps.items():
+            for mapping in maps:
+                self.add_map(mapping, mode)
+
+    def add_map(self, mapping, mode=None):
+        if mode not in self.midi_maps:
+            self.midi_maps[mode] = dict()
+        self.midi_maps[mode][mapping.name] = mapping
+
+    def get_map(self, map_name, mode=None):
+        return self.midi_maps[mode][map_name]
+
+    def handle_frame(self, data):
+        """
+        Pass the states of a frame to the mappings
+
+        :param data: Frame bytes
+        :return: None
+        """
+        if len(data) < HEADER.size:
+            self.invalid += 1
+            return
+        magic, version, session, sequence, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            self.invalid += 1
+            logging.warning(f'Bridge {self} received an unknown frame')
+            return
+        try:
+            events = decode_events(data, count)
+        except (ValueError, struct.error) as e:  # UnicodeDecodeError is a ValueError
+            self.invalid += 1
+            logging.warning(f'Bridge {self} discarded an invalid frame: {e}')
+            return
+        if session != self.session:
+            if self.session is not None:
+                logging.info(f'Bridge {self} sender restarted')
+            self.session = session
+            self.sequence = None
+        if self.sequence is not None and self.protocol == 'udp':
+            gap = (sequence - self.sequence) % SEQUENCE
+            if gap == 0 or gap > SEQUENCE // 2:
+                self.late += 1
+                return
+            self.lost += gap - 1
+        self.sequence = sequence
+        self.received += 1
+        self.stats.messages.inc(count)
+        for mode, name, state in events:
+            mapping = self.midi_maps.get(mode, {}).get(name) or self.midi_maps.get(None, {}).get(name)
+            if mapping is None:
+                self.unknown += 1
+                continue
+            self.mode = mode
+            mapping.receive(self, state)
+
+    def read_connection(self, connection):
+        """
+        Handle the complete frames received on a TCP connection
+
+        :param connection: socket
+        :return: None
+        """
+        try:
+            chunk = connection.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            chunk = b''
+        if not chunk:
+            del self.connections[connection]
+            connection.close()
+            return
+        buffer = self.connections[connection] + chunk
+        while len(buffer) >= LENGTH.size:
+            length = LENGTH.unpack_from(buffer)[0]
+            if len(buffer) < LENGTH.size + length:
+                break
+            self.handle_frame(buffer[LENGTH.size:LENGTH.size + length])
+            buffer = buffer[LENGTH.size + length:]
+        self.connections[connection] = buffer
+
+    def check_inputs(self, timeout=0):
+        """
+        Handle the frames received, waiting up to a timeout for the first one
+
+        :param timeout: Seconds to wait for a frame
+        :return: None
+        """
+        readable, _, _ = select.select([self.socket] + list(self.connections), [], [], timeout)
+        for ready in readable:
+            if ready is not self.socket:
+                self.read_connection(ready)
+            elif self.protocol == 'tcp':
+                connection, address = self.socket.accept()
+                connection.setblocking(False)
+                self.connections[connection] = b''
+                logging.info(f'Bridge {self} connected from {address[0]}:{address[1]}')
+            else:
+                while True:
+                    try:
+                        data = self.socket.recv(65536)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    self.handle_frame(data)
+        self.end_cycle()
+
+    def end_cycle(self):
+        """
+        Called after the received frames were handled, running the cycle_hooks (as midi.device Device end_cycle())
+
+        :return: None
+        """
+        for hook in self.cycle_hooks:
+            hook()
+
+    def monitor_inputs(self):
+        """
+        Blocking method to continually handle the frames received
+        :return: None
+        """
+        while True:
+            self.check_inputs(timeout=1)
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = dict()
+        self.socket.close()
@@ -0,0 +1,152 @@
+import math
+from array import array
+from collections import OrderedDict
+
+"""
+Response curves for MIDI controls.
+
+A curve is a plain function which is compiled once into a lookup table covering every possible raw value of a
+control (128 entries for 7-bit values, 16384 entries for 14-bit coarse/fine pairs). Mappings then convert an incoming
+value to a state with a single table index. Mappings with the same configuration share one table.
+
+Absolute curves (eg: for sliders) receive and return a position between 0 and 1.0.
+Relative curves (eg: for jog dials and browsers) receive and return a signed number of ticks.
+
+"""
+
+BITS_7 = 7
+BITS_14 = 14
+
+MAX_TABLES = 64  # Shared tables kept for new mappings, the least recently used are dropped
+
+_tables = OrderedDict()  # Compiled tables keyed by (key, bits, typecode), least recently used first
+
+
+def curve_key(curve):
+    """
+    Key of a curve by value, so that equal curves created again (eg: logarithmic(10) in a reloaded configuration)
+    share their tables: its code, defaults and closure values
+
+    :param curve: curve function
+    :return: Hashable description of the curve, or the curve itself if its values are not hashable
+    """
+    code = getattr(curve, '__code__', None)
+    if code is None:
+        return curve
+    key = (curve.__module__, curve.__qualname__, code.co_code, code.co_consts, curve.__defaults__,
+           tuple(cell.cell_contents for cell in curve.__closure__ or ()))
+    try:
+        hash(key)
+    except (TypeError, ValueError):  # Unhashable or empty closure values
+        return curve
+    return key
+
+
+def compile_table(func, bits=BITS_7, typecode='d', key=None):
+    """
+    Compile a transfer function into a lookup table of all possible raw values
+
+    :param func: function accepting a raw integer value and returning the converted value
+    :param bits: (int) Resolution of the raw value, 7 (128 entries) or 14 (16384 entries)
+    :param typecode: array typecode of the table, eg: 'd' for float or 'l' for integer values
+    :param key: Hashable description of the function (eg: mapping class, invert and curve_key() of the curve),
+    functions with the same key share one table which must not be modified. None to always compile the table
+    :return: array of converted values indexed by raw value
+    """
+    if key is None:
+        return array(typecode, (func(raw) for raw in range(1 << bits)))
+    table = _tables.get((key, bits, typecode))
+    if table is None:
+        table = _tables[(key, bits, typecode)] = array(typecode, (func(raw) for raw in range(1 << bits)))
+        if len(_tables) > MAX_TABLES:
+            _tables.popitem(last=False)  # Still used by its mappings, no longer shared with new ones
+    else:
+        _tables.move_to_end((key, bits, typecode))
+    return table
+
+
+def shared_tables():
+    """
+    :return: dict of the shared tables keyed by id, eg: as copy.deepcopy memo so that copies of mappings keep sharing
+    their tables
+    """
+    return {id(table): table for table in _tables.values()}
+
+
+def linear(x):
+    """
+    Linear curve - the position or ticks are unchanged
+
+    :param x: position (0-1.0) or ticks
+    :return: position (0-1.0) or ticks
+    """
+    return x
+
+
+def logarithmic(base=10):
+    """
+    Creates logarithmic (audio taper) curve for absolute controls, eg: a volume fader
+
+    :param base: Steepness of the curve (> 1)
+    :return: curve function
+    """
+    def curve(x):
+        return math.log1p(x * (base - 1)) / math.log(base)
+    return curve
+
+
+def exponential(base=10):
+    """
+    Creates exponential curve for absolute controls, the inverse of the logarithmic curve
+
+    :param base: Steepness of the curve (> 1)
+    :return: curve function
+    """
+    def curve(x):
+        return (base ** x - 1) / (base - 1)
+    return curve
+
+
+def power(exponent=2):
+    """
+    Creates power curve for absolute controls. Exponents above 1 give finer control at the start of the travel.
+
+    :param exponent: curve exponent
+    :return: curve function
+    """
+    def curve(x):
+        return x ** exponent
+    return curve
+
+
+def acceleration(factor=0.5, exponent=2):
+    """
+    Creates acceleration curve for relative controls, eg: jog dials. Slow rotations keep their resolution
+    while fast rotations (many ticks per message) are amplified.
+
+    :param factor: Amount of acceleration, 0 for none
+    :param exponent: How quickly the acceleration increases with rotation speed
+    :return: curve function
+    """
+    def curve(ticks):
+        return math.copysign(abs(ticks) + factor * (abs(ticks) ** exponent - abs(ticks)), ticks)
+    return curve
+
+
+class TableAttribute:
+    """
+    Mapping attribute which the lookup table of the mapping is compiled from (eg: invert or curve).
+
+    Changing the attribute after the mapping is created recompiles the table using the mapping compile() method,
+    so existing configurations like <mapping>.invert = True keep working.
+    """
+    def __set_name__(self, owner, name):
+        self.attr = '_' + name
+
+    def __get__(self, obj, objtype=None):
+        return self if obj is None else getattr(obj, self.attr)
+
+    def __set__(self, obj, value):
+        setattr(obj, self.attr, value)
+        if 'table' in obj.__dict__:
+            obj.compile()
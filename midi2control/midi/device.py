@@ -1,9 +1,18 @@
 import logging
+import asyncio
+import threading
 import time
+from collections import deque
 import mido
 
-from midi2control import notify_user
+from midi2control import notify_user, NOTIFIER
+from midi2control.clock import CLOCK
+from midi2control.metrics import DeviceMetrics
+from midi2control.midi.breaker import Breakers
+from midi2control.control import Sinks, output_label
 from midi2control.midi.mapping import MidiMap
+from midi2control.midi.dispatcher import priority, PRIORITIES
+from midi2control.midi.message import RawMessage
 
 
 """
@@ -58,8 +67,99 @@ def open_output(device_name):
     return mido.open_output(device_name)
 
 
+STATUS = {'note_on': 0x90, 'control_change': 0xB0}  # Status bytes (channel 0) of the message types mappings handle
+
+
+class InputFilter:
+    def __init__(self, maps=()):
+        """
+        Union of the message types, channels and note/control numbers a set of mappings listen to.
+
+        Compiled into a byte level table indexed by the status byte and first data byte of a message, so messages
+        can be discarded before a mido message is created from them, and a dispatch table of the mappings for
+        each accepted index.
+
+        :param maps: iterable of midi.mapping MidiMap instances
+        """
+        self.table = bytearray(256 * 128)
+        self.routes = dict()  # tuple of mappings keyed by table index
+        for m in maps:
+            self.add(m)
+
+    def add(self, mapping):
+        """
+        Accept the messages of a mapping
+
+        :param mapping: midi.mapping MidiMap instance
+        :return: None
+        """
+        for typ, status in STATUS.items():
+            if mapping.type is not None and mapping.type != typ:
+                continue
+            numbers = mapping.control if typ == 'control_change' else mapping.note
+            numbers = range(128) if numbers is None else list(flatten(numbers))
+            for channel in range(16) if mapping.channel is None else flatten(mapping.channel):
+                offset = (status | channel) << 7
+                for number in numbers:
+                    self.table[offset | number] = 1
+                    self.routes[offset | number] = self.routes.get(offset | number, ()) + (mapping, )
+
+    def accepts(self, data):
+        """
+        Whether any mapping listens to a message
+
+        :param data: MIDI message bytes
+        :return: (bool)
+        """
+        return len(data) > 1 and self.table[(data[0] << 7) | data[1]] == 1
+
+    def route(self, data):
+        """
+        Mappings listening to a message
+
+        :param data: MIDI message bytes
+        :return: tuple of midi.mapping MidiMap instances
+        """
+        if len(data) < 2:
+            return ()
+        return self.routes.get((data[0] << 7) | data[1], ())
+
+
+class ModeState:
+    __slots__ = ('input_filter', 'leds', 'radios')
+
+    def __init__(self, maps=()):
+        """
+        Entry state of a mode compiled ahead of a mode change: the input filter and dispatch table,
+        the mappings with button LEDs and the radio groups
+
+        :param maps: iterable of midi.mapping MidiMap instances of the mode
+        """
+        maps = list(maps)
+        self.input_filter = InputFilter(maps)
+        self.leds = list()  # Mappings with led_frames()
+        self.radios = dict()  # tuple of mappings keyed by radio group name
+        for m in maps:
+            self.add(m, route=False)
+
+    def add(self, mapping, route=True):
+        """
+        Add a mapping to the mode
+
+        :param mapping: midi.mapping MidiMap instance
+        :param route: (bool) Also add the mapping to the input filter
+        :return: None
+        """
+        if route:
+            self.input_filter.add(mapping)
+        if hasattr(mapping, 'led_frames'):
+            self.leds.append(mapping)
+        if mapping.radio is not None:
+            self.radios[mapping.radio] = self.radios.get(mapping.radio, ()) + (mapping, )
+
+
 class Device:
-    def __init__(self, name, device_name=None, midi_maps=None, timeout=None, wait=5):
+    def __init__(self, name, device_name=None, midi_maps=None, timeout=None, wait=5, clock=None, ports=None):
         """
         MIDI device basic class. Can be extended for specific manufacturers or products
 
@@ -69,20 +169,55 @@ class Device:
         to use with this device (can be added later wth the methods add_maps or add_map)
         :param timeout: (int) Seconds to wait for device connection or None if it should wait indefinitely
         :param wait: Seconds to wait before reattempting (re)connection
+        :param clock: midi2control.clock Clock used for waits and timers (defaults to the wall clock)
+        :param ports: (inport, outport) to use instead of the mido ports of the device_name,
+        eg: midi.memory MemoryPort for tests
         """
 
         self.name = name
         self.device_name = device_name or name
         self.timeout = timeout
         self.wait = wait
+        self.clock = clock or CLOCK
+        self.ports = ports
         self.inport = None
         self.outport = None
+        self.leds = Sinks()  # Last LED velocity sent, keyed by (channel, note)
+        self.listener = None  # Function receiving (device, msg) from the MIDI backend instead of polling
+        self.scheduler = None  # Event loop running the device timers (eg: midi.hub Hub), or None for thread timers
+        self.output_semaphore = None  # Limits concurrent async def outputs when run in an asyncio event loop
+        self.mode_state = ModeState()  # ModeState of the current mode
+        self.mode_states = {None: self.mode_state}  # ModeState of each mode keyed by mode name, see compile_modes()
+        self.input_filter = self.mode_state.input_filter  # Messages the mappings of the current mode listen to
+        self.modes = None  # Ordered tuple of the mode names, see get_mode_key()
+        self.received = deque()  # Messages received from the MIDI backend thread for polling, if there is no listener
 
-        self.connect()
+        # Sync phase, see sync()
+        self.ready = threading.Event()  # Set once the device state is in sync with the physical controls
+        self.ready.set()
+        self.syncing = False
+        self.sync_quiet = None
+        self.sync_timeout = None
+        self.sync_outputs = False
+        self.sync_started = None
+        self.sync_last = None
+        self.sync_timer = None
+        self.absorbed = dict()  # Last message of each mapping whose outputs were held back during the sync phase
+        self.pending_reload = None  # New mapping configuration to apply before the next messages, see reload()
+        self.deferred = deque()  # Device methods called on the output dispatcher thread, see defer()
+        self.dispatcher = None  # midi.dispatcher OutputDispatcher executing outputs in the background, or None inline
+        self.profiler = None  # midi2control.profiler Profiler of the mappings and outputs, or None
+        self.state_log = None  # midi2control.timeseries StateLog recording the mapping states, or None
+        self.bridge = None  # midi.bridge BridgeSender forwarding the mapping states to another machine, or None
+        self.cycle_hooks = list()  # Functions called at the end of each poll cycle, see end_cycle()
+        self.stats = DeviceMetrics(name)  # midi2control.metrics instruments of the device
+        self.breakers = Breakers(clock=self.clock)  # midi.breaker circuit breakers isolating failing outputs
 
         self.midi_maps = dict()  # Accessible using keys
         self.mode = None
 
+        self.connect()
+
         if midi_maps:
             self.add_maps(midi_maps)
 
@@ -101,27 +236,253 @@ class Device:
 
         :return: None
         """
-        start_time = time.time()
-        while not self.timeout or time.time() - start_time <= self.timeout:
+        if self.ports:
+            self.open()
+            return
+        start_time = self.clock.monotonic()
+        while not self.timeout or self.clock.monotonic() - start_time <= self.timeout:
             if self.device_name in read_midi_devices()[0]:
-                self.inport = open_input(self.device_name)
-                self.outport = open_output(self.device_name)
-                logging.info(f'Device {self} connected')
+                self.open()
                 return
             else:
                 for candidate in read_midi_devices()[0]:
                     if candidate.startswith(self.device_name) or candidate.startswith(self.name):
                         logging.warning(f'Device name {self.device_name} not found, using {candidate}')
                         self.device_name = candidate
-                        self.inport = open_input(self.device_name)
-                        self.outport = open_output(self.device_name)
-                        logging.info(f'Device {self} connected')
+                        self.open()
                         return
             logging.warning(f'Device {self} not found, waiting {self.wait} seconds')
-            time.sleep(self.wait)
+            self.clock.sleep(self.wait)
 
         raise TimeoutError(f'Device {self} not found')
 
+    def open(self):
+        """
+        Open the input and output ports of the device_name (or the ports passed to the device)
+
+        :return: None
+        """
+        if self.ports:
+            self.inport, self.outport = self.ports
+        else:
+            self.inport = open_input(self.device_name)
+            self.outport = open_output(self.device_name)
+        self.leds.forget()
+        self.stats.connections.inc()
+        if self.raw_input():
+            # Receive the message bytes directly to filter them before mido messages are created
+            self.received.clear()
+            self.inport._rt.set_callback(self.receive_bytes)
+            self.update_filter()
+        elif self.listener:
+            self.inport.callback = self.receive
+        logging.info(f'Device {self} connected')
+
+    def raw_input(self):
+        """
+        :return: (bool) True if the message bytes can be received from the MIDI backend (rtmidi)
+        """
+        return hasattr(getattr(self.inport, '_rt', None), 'set_callback')
+
+    def update_filter(self):
+        """
+        Recalculate the messages the mappings of the current mode listen to, pushing the filter to the MIDI backend.
+        Called when the mode or mappings change.
+
+        :return: None
+        """
+        self.mode_state = self.compile_mode(self.mode)
+        self.input_filter = self.mode_state.input_filter
+        if self.raw_input():
+            # No mapping handles system exclusive, clock or active sensing messages
+            self.inport._rt.ignore_types(sysex=True, timing=True, active_sense=True)
+
+    def compile_mode(self, mode):
+        """
+        Entry state of a mode, compiled when first needed
+
+        :param mode: Mode name or None for default mode
+        :return: ModeState
+        """
+        state = self.mode_states.get(mode)
+        if state is None:
+            state = self.mode_states[mode] = ModeState(self.midi_maps.get(mode, dict()).values())
+        return state
+
+    def compile_modes(self):
+        """
+        Compile the entry state of all modes and the ordered mode list ahead of mode changes
+
+        :return: None
+        """
+        self.modes = tuple(self.midi_maps)
+        for mode in self.modes:
+            self.compile_mode(mode)
+
+    def check_connection(self):
+        """
+        Reconnect if the device is no longer listed
+
+        :return: (bool) True if the device was reconnected
+        """
+        if not self.ports and self.device_name not in read_midi_devices()[0]:
+            self.connect()
+            return True
+        return False
+
+    def listen(self, listener):
+        """
+        Deliver incoming messages to a listener from the MIDI backend thread instead of polling with check_inputs().
+        The listener is kept on reconnection.
+
+        :param listener: function accepting the device and the mido message, or None to stop listening
+        :return: (bool) True if the input port supports listeners (otherwise it must be polled)
+        """
+        if self.raw_input():
+            self.listener = listener
+            return True
+        # Only some mido backends deliver messages to a port callback
+        if not isinstance(getattr(type(self.inport), 'callback', None), property):
+            self.listener = None
+            return False
+        self.listener = listener
+        self.inport.callback = self.receive if listener else None
+        return True
+
+    def receive(self, msg):
+        """
+        Pass a message received from the input port to the listener
+
+        :param msg: mido message received from the device
+        :return: None
+        """
+        self.listener(self, msg)
+
+    def receive_bytes(self, event, data=None):
+        """
+        Filter message bytes received from the MIDI backend thread, passing accepted messages to the listener
+        or queuing them for polling. Messages are passed as midi.message RawMessage, read directly from the bytes
+
+        :param event: tuple of message bytes and delta time
+        :param data: unused callback data
+        :return: None
+        """
+        message = event[0]
+        if not self.input_filter.accepts(message):
+            self.stats.filtered.inc()
+            return
+        msg = RawMessage(bytes(message))
+        if self.listener:
+            self.listener(self, msg)
+        else:
+            self.received.append(msg)
+
+    def pending(self):
+        """
+        Received messages which the mappings of the current mode listen to
+
+        :return: generator of mido messages
+        """
+        if self.raw_input():
+            received = self.received
+            while received:
+                yield received.popleft()
+        else:
+            for msg in self.inport.iter_pending():
+                if self.input_filter.accepts(msg.bytes()):
+                    yield msg
+                else:
+                    self.stats.filtered.inc()
+
+    def call_later(self, delay, func, *args):
+        """
+        Execute a function after a delay, eg: for animations. Runs on the scheduler event loop if the device has one
+        (eg: midi.hub Hub), otherwise by the device clock (a timer thread for the wall clock).
+
+        :param delay: Seconds to wait
+        :param func: function to execute
+        :param args: un-named arguments of the function
+        :return: Timer which can be cancelled with cancel()
+        """
+        if self.scheduler is not None:
+            return self.scheduler.call_later(delay, func, *args)
+        return self.clock.call_later(delay, func, *args)
+
+    def defer(self, func, *args):
+        """
+        Execute a function on the thread handling the messages if called on the output dispatcher thread, so that an
+        output (eg: change_mode()) does not change the mode while messages are being routed. The function runs on the
+        scheduler event loop if the device has one, otherwise before the next messages are handled.
+
+        :param func: function to execute
+        :param args: un-named arguments of the function
+        :return: (bool) True if deferred, False if the caller is not the dispatcher thread and should execute it now
+        """
+        dispatcher = self.dispatcher
+        if dispatcher is None or threading.current_thread() is not dispatcher.thread:
+            return False
+        self.deferred.append((func, args))
+        if self.scheduler is not None:
+            getattr(self.scheduler, 'call_soon_threadsafe', self.scheduler.call_soon)(self.run_deferred)
+        return True
+
+    def run_deferred(self):
+        """
+        Execute the functions passed to defer()
+
+        :return: None
+        """
+        while self.deferred:
+            func, args = self.deferred.popleft()
+            func(*args)
+
+    def led(self, channel, note, velocity, frame=None):
+        """
+        Set a LED of the device using a note_on message. Skipped if the LED already shows this velocity
+
+        :param channel: (int) MIDI channel
+        :param note: (int) MIDI note of the LED
+        :param velocity: (int) LED velocity, eg: 127 for on and 0 for off
+        :param frame: Prebuilt bytes of the note_on message (optional)
+        :return: None
+        """
+        if self.leds.changed((channel, note), velocity):
+            self.send_bytes(frame or bytes((0x90 | channel, note, velocity)))
+
+    def flush_leds(self, maps=None):
+        """
+        Show the state of the button LEDs in one batch, eg: after restoring the mapping states.
+        Only the LEDs which do not already show the state are sent.
+
+        :param maps: midi.mapping MidiMap instances with led_frames() (defaults to those of the current mode)
+        :return: None
+        """
+        if maps is None:
+            maps = self.mode_state.leds
+        frames = list()
+        for m in maps:
+            if not hasattr(m, 'led_frames'):
+                continue
+            velocity = 127 if m.current_state else 0
+            for channel, note, on, off in m.led_frames():
+                if self.leds.changed((channel, note), velocity):
+                    frames.append(on if velocity else off)
+        for frame in frames:
+            self.send_bytes(frame)
+
+    def send_bytes(self, frame):
+        """
+        Send a MIDI message to the device. The bytes are sent directly if supported by the MIDI backend (rtmidi)
+
+        :param frame: MIDI message bytes
+        :return: None
+        """
+        rt = getattr(self.outport, '_rt', None)
+        if rt is not None:
+            rt.send_message(frame)
+        else:
+            self.outport.send(mido.Message.from_bytes(frame))
+
     def radio(self, mapping):
         """
         Change states of all mappings in a group. None initiating mappings will be set to the opposite
@@ -130,8 +491,8 @@ class Device:
         :return: None
         """
         if mapping.radio is not None:
-            for m in self.midi_maps.get(self.mode).values():
-                if m != mapping and m.radio == mapping.radio:
+            for m in self.mode_state.radios.get(mapping.radio, ()):
+                if m != mapping:
                     m.off(mapping, self)
 
     def check_inputs(self):
@@ -141,17 +502,222 @@ class Device:
         :return: None
         """
 
-        if self.device_name not in read_midi_devices()[0]:
-            self.connect()
+        self.check_connection()
+        self.check_sync()
+        self.dispatch_batch(self.pending())
+
+    def matching(self, msg):
+        """
+        Mappings of the current mode matching a MIDI message
+
+        :param msg: mido message or midi.message RawMessage received from the device
+        :return: tuple of midi.mapping MidiMap instances
+        """
+        data = msg.data if isinstance(msg, RawMessage) else msg.bytes()
+        return self.input_filter.route(data)
+
+    def dispatch(self, msg):
+        """
+        Pass a MIDI message to the matching mappings of the current mode
+
+        :param msg: mido message received from the device
+        :return: None
+        """
+        if self.pending_reload is not None:
+            self.apply_reload()
+        if self.deferred:
+            self.run_deferred()
+        logging.debug(msg)
+        if self.syncing:
+            self.sync_received()
+        start = time.perf_counter()
+        self.stats.messages.inc()
+        profiler = self.profiler
+        for m in self.matching(msg):
+            if profiler is None:
+                m.message(self, msg)
+            else:
+                profiler.message(m, self, msg)
+        self.stats.dispatch_seconds.observe(time.perf_counter() - start)
 
-        for msg in self.inport.iter_pending():
+    def dispatch_batch(self, msgs):
+        """
+        Pass MIDI messages received together to the matching mappings of the current mode.
+
+        Edges (eg: button presses) are handled before continuous mappings (eg: jog dials), so a button is handled
+        within one poll regardless of other traffic. Within a priority class mappings take turns,
+        and the messages of each mapping stay in order. If handling a message changes the mode, the messages
+        received after it are routed again to the mappings of the new mode.
+
+        :param msgs: iterable of mido messages received from the device
+        :return: None
+        """
+        if self.pending_reload is not None:
+            self.apply_reload()
+        if self.deferred:
+            self.run_deferred()
+        start = time.perf_counter()
+        msgs = list(msgs)
+        for msg in msgs:
             logging.debug(msg)
-            for map_name, m in self.midi_maps.get(self.mode, dict()).items():
-                if m.type is None or m.type == msg.type:
-                    if m.channel is None or msg.channel in flatten(m.channel):
-                        if ((msg.type == 'control_change' and (m.control is None or msg.control in flatten(m.control)))
-                                or (msg.type == 'note_on' and (m.note is None or msg.note in flatten(m.note)))):
-                            m.message(self, msg)
+            if self.syncing:
+                self.sync_received()
+
+        index = 0
+        handled = set()
+        while index < len(msgs):
+            index = self.dispatch_run(msgs, index, handled)
+
+        if msgs:
+            self.stats.messages.inc(len(msgs))
+            self.stats.dispatch_seconds.observe(time.perf_counter() - start)
+        self.end_cycle()
+
+    def dispatch_run(self, msgs, first, handled):
+        """
+        Pass messages to the mappings of the current mode, see dispatch_batch(), until one changes the mode.
+        As mappings take turns, messages received after the one changing the mode may already have been handled in
+        the previous mode, they are not routed again.
+
+        :param msgs: list of mido messages received from the device
+        :param first: (int) Index of the first message to pass
+        :param handled: set of the indexes of the messages handled by a mapping, updated
+        :return: (int) Index of the first message received after the mode changed, or the number of messages
+        """
+        mode_state = self.mode_state
+        queues = tuple(dict() for _ in PRIORITIES)  # deque of (index, message) keyed by mapping, in order of arrival
+        for index in range(first, len(msgs)):
+            if index in handled:
+                continue
+            msg = msgs[index]
+            for m in self.matching(msg):
+                queue = queues[priority(m)]
+                if m not in queue:
+                    queue[m] = deque()
+                queue[m].append((index, msg))
+
+        restart = len(msgs)
+        profiler = self.profiler
+        for queue in queues:
+            while queue:
+                for m in list(queue):
+                    index, msg = queue[m].popleft()
+                    if index >= restart:
+                        del queue[m]  # Received after the mode changed, routed again
+                        continue
+                    if profiler is None:
+                        m.message(self, msg)
+                    else:
+                        profiler.message(m, self, msg)
+                    handled.add(index)
+                    if self.mode_state is not mode_state and restart == len(msgs):
+                        restart = index + 1
+                    if not queue[m]:
+                        del queue[m]
+        return restart
+
+    def end_cycle(self):
+        """
+        Called at the end of each poll cycle, running the cycle_hooks, eg: to send the states forwarded by a bridge
+        in one frame or the OSC messages of the outputs in one bundle
+
+        :return: None
+        """
+        for hook in self.cycle_hooks:
+            hook()
+
+    def process_batch(self, messages, outputs=False, vectorise=True):
+        """
+        Process recorded messages (eg: midi.batch read_midi_file()) into a timeline of mapping states,
+        without the device ports. Ends a sync phase, as there is no controller to wait for.
+
+        The output dispatcher, state log, bridge and cycle hooks are detached while a block of messages is processed,
+        so the device should not handle live messages at the same time.
+
+        :param messages: iterable of (time, message), the message as bytes or a mido or midi.message RawMessage
+        :param outputs: (bool) Also execute the output functions of the mappings (eg: mode changes)
+        :param vectorise: (bool) Calculate the states of whole blocks of messages with numpy where possible
+        (only without outputs)
+        :return: generator of (time, mode, mapping name, state) for each state output by a mapping
+        """
+        from midi2control.midi.batch import process
+        return process(self, messages, outputs, vectorise)
+
+    def sync(self, quiet=0.25, timeout=3, outputs=False):
+        """
+        Start a sync phase, eg: after requesting the controller to send the positions of all its controls.
+
+        During the sync phase messages update the mapping states without executing their outputs. The phase ends
+        once no message was received for the quiet period (or after the timeout), counted from when the device
+        is first run. Then the ready event is set.
+
+        :param quiet: Seconds without messages after which the state dump is considered complete
+        :param timeout: Maximum seconds of the sync phase
+        :param outputs: (bool) Execute the outputs of each mapping which changed once at the end of the sync phase
+        :return: None
+        """
+        self.ready.clear()
+        self.syncing = True
+        self.sync_quiet = quiet
+        self.sync_timeout = timeout
+        self.sync_outputs = outputs
+        self.sync_started = None
+        self.absorbed = dict()
+        logging.info(f'Device {self} syncing')
+
+    def absorb(self, mapping, msg=None):
+        """
+        Hold back the outputs of a mapping during the sync phase
+
+        :param mapping: midi.mapping MidiMap instance
+        :param msg: mido message received from the device
+        :return: None
+        """
+        self.absorbed[mapping] = msg
+
+    def sync_received(self):
+        """
+        Record a message received during the sync phase, which extends the quiet period
+
+        :return: None
+        """
+        self.sync_last = self.clock.monotonic()
+
+    def check_sync(self):
+        """
+        End the sync phase if the state dump is complete, otherwise check again after the quiet period.
+        Without a scheduler the check is repeated by check_inputs(), so the held back outputs are executed
+        on the polling thread rather than a timer thread.
+
+        :return: None
+        """
+        if not self.syncing:
+            return
+        now = self.clock.monotonic()
+        if self.sync_started is None:
+            self.sync_started = self.sync_last = now
+        if now - self.sync_last >= self.sync_quiet or now - self.sync_started >= self.sync_timeout:
+            self.finish_sync()
+        elif self.sync_timer is None and self.scheduler is not None:
+            def tick():
+                self.sync_timer = None
+                self.check_sync()
+            self.sync_timer = self.call_later(self.sync_quiet, tick)
+
+    def finish_sync(self):
+        """
+        End the sync phase, executing the held back outputs once per mapping if configured
+
+        :return: None
+        """
+        self.syncing = False
+        absorbed, self.absorbed = self.absorbed, dict()
+        logging.info(f'Device {self} synced {len(absorbed)} mappings')
+        if self.sync_outputs:
+            for mapping, msg in absorbed.items():
+                mapping.output(self, msg)
+            self.end_cycle()
+        self.ready.set()
 
     def monitor_inputs(self):
         """
@@ -159,8 +725,73 @@ class Device:
 
         :return: None
         """
+        from midi2control.midi.hub import Hub
+        Hub([self]).run()
+
+    async def messages(self, poll_interval=0.001):
+        """
+        Asynchronous iterator of incoming MIDI messages for use in an asyncio event loop, eg:
+
+            async for msg in device.messages():
+                print(msg)
+
+        :param poll_interval: Seconds between polls if the input port does not support listeners
+        :return: async generator of mido messages
+        """
+        loop = asyncio.get_running_loop()
+        messages = asyncio.Queue()
+        if self.listen(lambda device, msg: loop.call_soon_threadsafe(messages.put_nowait, msg)):
+            try:
+                while True:
+                    yield await messages.get()
+            finally:
+                self.listen(None)
+        else:
+            while True:
+                for msg in self.pending():
+                    yield msg
+                await asyncio.sleep(poll_interval)
+
+    async def watch_connection(self, check_interval=1):
+        """
+        Asynchronous task to reconnect the device if required. The (blocking) connection runs in the loop executor
+
+        :param check_interval: Seconds between checks of the connection
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
         while True:
-            self.check_inputs()
+            await asyncio.sleep(check_interval)
+            await loop.run_in_executor(None, self.check_connection)
+
+    async def run(self, max_outputs=8, check_interval=1):
+        """
+        Asynchronous alternative to monitor_inputs() for use in an asyncio event loop, eg: asyncio.run(device.run())
+
+        Messages are dispatched to the mappings on the loop. Output functions defined with async def run as tasks,
+        so slow outputs (eg: network lights) overlap and do not block the input handling.
+        Device timers (eg: animations), reconnection and notifications also run on the loop.
+
+        :param max_outputs: Maximum number of async def outputs running concurrently
+        :param check_interval: Seconds between checks of the connection
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        self.scheduler = loop
+        self.output_semaphore = asyncio.Semaphore(max_outputs)
+        self.check_sync()
+        tasks = [loop.create_task(self.watch_connection(check_interval))]
+        if NOTIFIER.thread is None and NOTIFIER.loop is None:
+            tasks.append(loop.create_task(NOTIFIER.serve()))
+        try:
+            async for msg in self.messages():
+                self.dispatch(msg)
+                self.end_cycle()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.scheduler = None
+            self.output_semaphore = None
 
     def add_maps(self, midi_maps):
         """
@@ -172,6 +803,7 @@ class Device:
         for mode, maps in midi_maps.items():
             for mapping in maps:
                 self.add_map(mapping, mode)
+        self.compile_modes()
     
     def add_map(self, mapping, mode=None):
         """
@@ -183,7 +815,108 @@ class Device:
         """
         if mode not in self.midi_maps:
             self.midi_maps[mode] = dict()
+            self.modes = None
+        replaced = mapping.name in self.midi_maps[mode]
         self.midi_maps[mode][mapping.name] = mapping
+        if mode == self.mode and not replaced:
+            self.mode_state.add(mapping)
+        else:
+            self.mode_states.pop(mode, None)
+            if mode == self.mode:
+                self.update_filter()
+
+    def load_profile(self, path, cache_dir=None, artifact=None):
+        """
+        Replace the mappings with those of a declarative profile, see midi.profile.
+        The compiled profile (mappings and dispatch tables) is loaded from the cache if the profile is unchanged.
+
+        :param path: Path of a .json or .toml profile
+        :param cache_dir: Directory of compiled profiles (defaults to ~/.cache/midi2control)
+        :param artifact: dict artifact of the profile already loaded with midi.profile load_artifact(), or None
+        :return: dict of resources created for the outputs, keyed by name
+        """
+        from midi2control.midi.profile import load_artifact, bind_outputs
+        if artifact is None:
+            artifact = load_artifact(path, cache_dir)
+        self.midi_maps = artifact['midi_maps']
+        self.mode_states = artifact['modes']
+        if self.mode not in self.midi_maps:
+            self.mode = next(iter(self.midi_maps), None)
+        self.compile_modes()
+        self.update_filter()
+        return bind_outputs(self, artifact)
+
+    @classmethod
+    def from_profile(cls, path, cache_dir=None, **kwargs):
+        """
+        Create a device from a declarative profile, see midi.profile
+
+        :param path: Path of a .json or .toml profile
+        :param cache_dir: Directory of compiled profiles (defaults to ~/.cache/midi2control)
+        :param kwargs: Device arguments, overriding those of the profile
+        :return: Device instance
+        """
+        from midi2control.midi.profile import load_artifact
+        artifact = load_artifact(path, cache_dir)
+        device = cls(**dict(artifact['device'], **kwargs))
+        device.load_profile(path, cache_dir, artifact)
+        return device
+
+    def reload(self, midi_maps):
+        """
+        Replace the mappings at runtime without reconnecting. The new configuration is applied between handling
+        messages: mappings with the same name and class keep their state (and object) and take over the new
+        configuration and outputs, other mappings are added or removed. Build the new mappings within midi.mapping
+        suppress_outputs(): their initial outputs are skipped, and only those of the added mappings and of mappings
+        whose outputs changed in the current mode are executed once the configuration is applied (outputs added with
+        initialise=False are not). Mappings which are kept do not execute their outputs again.
+
+        :param midi_maps: Dict of Lists of midi.mapping MidiMap instances (keyed by mode name)
+        :return: None
+        """
+        self.pending_reload = midi_maps
+        if self.scheduler is not None:
+            self.scheduler.call_later(0, self.apply_reload)
+
+    def apply_reload(self):
+        """
+        Apply the configuration passed to reload()
+
+        :return: None
+        """
+        midi_maps, self.pending_reload = self.pending_reload, None
+        if midi_maps is None:
+            return
+
+        reloaded = dict()
+        initialise = dict()  # Outputs to initialise keyed by mode, list of (mapping, outputs)
+        for mode, maps in midi_maps.items():
+            live = self.midi_maps.get(mode, dict())
+            reloaded[mode] = dict()
+            initialise[mode] = list()
+            for mapping in maps:
+                outputs = mapping.__dict__.pop('initialise_outputs', ())
+                old = live.get(mapping.name)
+                if old is not None and old.__class__ == mapping.__class__:
+                    if old is not mapping:
+                        if [output_label(f) for f in old.outputs] == [output_label(f) for f in mapping.outputs]:
+                            outputs = ()  # Same outputs, already executed with the kept state
+                        old.reconfigure(mapping)
+                    mapping = old
+                if outputs:
+                    initialise[mode].append((mapping, outputs))
+                reloaded[mode][mapping.name] = mapping
+
+        self.midi_maps = reloaded
+        self.mode_states = dict()
+        if self.mode not in self.midi_maps:
+            self.mode = next(iter(self.midi_maps), None)
+        self.compile_modes()
+        self.update_filter()
+        for mapping, outputs in initialise.get(self.mode, ()):
+            mapping.initialise(outputs, self)
+        logging.info(f'Device {self} reloaded {sum(len(maps) for maps in reloaded.values())} mappings '
+                     f'in {len(reloaded)} modes')
 
     def get_map(self, map_name, mode=None):
         """
@@ -205,11 +938,9 @@ class Device:
         """
 
         if self.midi_maps:
-
-            modes = list(self.midi_maps.keys())
-            mode_name = modes[integer % len(modes)]
-
-            return mode_name
+            if self.modes is None:
+                self.modes = tuple(self.midi_maps)
+            return self.modes[integer % len(self.modes)]
 
     def browse_mode(self, mapping, device=None, msg=None):
         """
@@ -230,6 +961,9 @@ class Device:
         """
 
         mode_key = self.get_mode_key(mapping.current_state)
+        # Have the cued mode ready to be switched to
+        if not self.defer(self.compile_mode, mode_key):
+            self.compile_mode(mode_key)
 
         if mode_key != self.mode:
             subject, message = f"MIDI Controller {self}", f" mode '{(mode_key or 'DEFAULT')}' ready for selection"
@@ -237,7 +971,7 @@ class Device:
             subject, message = f"MIDI Controller {self}", f"current mode {(self.mode or 'DEFAULT')}"
 
         logging.info(subject + ' ' + message)
-        notify_user(subject, message)
+        notify_user(subject, message, key=str(self))
 
     def change_mode(self, mode_key=None, mode_index=None):
         """
@@ -257,6 +991,9 @@ class Device:
         # Obtain current_state if the index source is a Map based object
         if MidiMap in mode_index.__class__.__mro__:
             mode_index = int(mode_index.current_state)
+        # Called by an output on the dispatcher thread, change the mode between handling messages
+        if self.defer(self.change_mode, mode_key, mode_index):
+            return
         # Use index to get mode_key
         if isinstance(mode_index, int):
             mode_key = self.get_mode_key(mode_index)
@@ -265,6 +1002,8 @@ class Device:
         if mode_key in self.midi_maps:
             if mode_key != self.mode:
                 self.mode = mode_key
+                self.update_filter()
+                self.flush_leds()
                 # Provide user feedback
                 self.animate()
                 subject, message = f"MIDI Controller {self}", f"changed to mode {(self.mode or 'DEFAULT')}"
@@ -275,7 +1014,7 @@ class Device:
             raise ValueError(f'Invalid mode {mode_key} selected!!')
 
         logging.info(subject + ' ' + message)
-        notify_user(subject, message)
+        notify_user(subject, message, key=str(self))
 
     def animate(self):
         """
@@ -0,0 +1,182 @@
+import logging
+import threading
+from collections import deque, Counter
+
+from midi2control.metrics import QUEUE_DEPTH, OUTPUT_DROPS
+
+"""
+Output dispatcher executing mapping outputs in a background thread through bounded queues.
+
+Without a dispatcher, outputs run inline when a message is handled. When outputs cannot keep up, the unhandled
+MIDI messages pile up in the MIDI backend and the latency grows without bound. The dispatcher puts a bounded queue
+per mapping between the input handling and the outputs, with a policy for what to do when a queue is full:
+
+- LATEST: only the latest state is kept (for continuous controls like jog dials, sliders and browsers).
+  Queued states are replaced, keeping the previous_state of the oldest so relative outputs see the whole change
+- NEVER_DROP: every state is queued (for button edges)
+- BLOCK: the input handling waits for space in the queue
+- DROP_OLDEST: the oldest queued state is dropped
+
+Dropped (or replaced) states are counted per mapping name in OutputDispatcher.drops
+
+Mappings also have a priority class. Discrete edges (eg: button presses) are handled before continuous updates
+(eg: jog dial or fader movement), so a button is not held up by a storm of continuous messages. Within a class,
+mappings take turns and the states of each mapping stay in order.
+
+"""
+
+LATEST = 'latest'
+NEVER_DROP = 'never_drop'
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+
+EDGE = 0
+CONTINUOUS = 1
+PRIORITIES = (EDGE, CONTINUOUS)
+
+
+def priority(mapping):
+    """
+    Priority class of a mapping. Mappings which do not define one are edges if they handle notes
+
+    :param mapping: midi.mapping MidiMap instance
+    :return: EDGE or CONTINUOUS
+    """
+    if mapping.priority is not None:
+        return mapping.priority
+    return EDGE if mapping.type in ('note_on', 'note_off') else CONTINUOUS
+
+
+class MapState:
+    __slots__ = ('mapping', 'previous_state', 'current_state')
+
+    def __init__(self, mapping, previous_state, current_state):
+        """
+        Snapshot of the state of a mapping, passed to the outputs in place of the mapping.
+        Other attributes are read from the mapping itself.
+
+        :param mapping: midi.mapping MidiMap instance
+        :param previous_state: previous_state of the mapping
+        :param current_state: current_state of the mapping
+        """
+        self.mapping = mapping
+        self.previous_state = previous_state
+        self.current_state = current_state
+
+    def __getattr__(self, item):
+        return getattr(self.mapping, item)
+
+    def __str__(self):
+        return f"{self.mapping.__class__.__name__}, {self.mapping.name}, {self.current_state}"
+
+
+class OutputDispatcher:
+    def __init__(self, maxsize=64, policy=BLOCK, name=None):
+        """
+        Executes mapping outputs in a background thread. Assign to a device (or hub) to use it:
+
+            ddj.dispatcher = OutputDispatcher()
+
+        :param maxsize: (int) Maximum number of queued states per mapping
+        :param policy: Policy for mappings which do not define one (BLOCK or DROP_OLDEST)
+        :param name: (str) Name of the dispatcher thread and metrics (defaults to the name of the device of the first
+        outputs, so the dispatchers of different devices have their own metrics)
+        """
+        self.name = None
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self.queues = dict()  # deque of (MapState, device, msg) keyed by mapping
+        self.ready = tuple(deque() for _ in PRIORITIES)  # Mappings with queued states by priority, in order of arrival
+        self.condition = threading.Condition()
+        self.drops = Counter()  # Number of dropped states keyed by mapping name
+        self.thread = None
+        if name is not None:
+            self.set_name(name)
+
+    def set_name(self, name):
+        """
+        :param name: (str) Name of the dispatcher thread and metrics
+        :return: None
+        """
+        self.name = name
+        QUEUE_DEPTH.labels(name).set_function(self.depth)
+
+    def depth(self):
+        """
+        :return: (int) Total number of queued states
+        """
+        with self.condition:
+            return sum(len(q) for q in self.queues.values())
+
+    def submit(self, mapping, device=None, msg=None):
+        """
+        Queue the outputs of a mapping with its current state
+
+        :param mapping: midi.mapping MidiMap instance
+        :param device: midi.device Device associated with this mapping
+        :param msg: mido message received from the device
+        :return: None
+        """
+        if threading.current_thread() is self.thread:
+            # Output of a mapping triggered by another output (eg: radio button), avoid waiting on ourselves
+            mapping.execute(MapState(mapping, mapping.previous_state, mapping.current_state), device, msg)
+            return
+
+        policy = mapping.policy or self.policy
+        state = MapState(mapping, mapping.previous_state, mapping.current_state)
+
+        with self.condition:
+            if self.thread is None:
+                if self.name is None:
+                    self.set_name(getattr(device, 'name', None) or 'outputs')
+                self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                self.thread.start()
+
+            queue = self.queues.get(mapping)
+            if queue is None:
+                queue = self.queues[mapping] = deque()
+
+            if policy == LATEST and queue:
+                state.previous_state = queue[-1][0].previous_state
+                queue[-1] = (state, device, msg)
+                self.drops[mapping.name] += 1
+                OUTPUT_DROPS.labels(mapping.name).inc()
+                return
+            if policy == BLOCK:
+                while len(queue) >= self.maxsize:
+                    self.condition.wait()
+            elif policy == DROP_OLDEST and len(queue) >= self.maxsize:
+                queue.popleft()
+                self.drops[mapping.name] += 1
+                OUTPUT_DROPS.labels(mapping.name).inc()
+                logging.debug(f'Output queue of {mapping} full, oldest state dropped')
+
+            if not queue:
+                self.ready[priority(mapping)].append(mapping)
+            queue.append((state, device, msg))
+            self.condition.notify_all()
+
+    def run(self):
+        """
+        Execute queued outputs. Runs in the dispatcher thread.
+        Edges are executed before continuous mappings. Within a priority class mappings take turns so one busy mapping
+        cannot hold up the others, and the states of each mapping are executed in order.
+
+        :return: None
+        """
+        while True:
+            with self.condition:
+                while not any(self.ready):
+                    self.condition.wait()
+                ready = next(r for r in self.ready if r)
+                mapping = ready.popleft()
+                queue = self.queues[mapping]
+                state, device, msg = queue.popleft()
+                if queue:
+                    ready.append(mapping)
+                self.condition.notify_all()
+            try:
+                mapping.execute(state, device, msg)
+            except Exception as e:
+                logging.exception(f'Output of {mapping} failed: {e}')
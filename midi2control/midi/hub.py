@@ -0,0 +1,195 @@
+import logging
+import heapq
+import queue
+import threading
+
+from midi2control.clock import TimerHandle, CLOCK
+
+"""
+Hub running several MIDI devices in a single event loop.
+
+Devices deliver their messages into the hub queue from the MIDI backend, so the loop blocks while there is nothing to
+do rather than polling. All mappings, outputs and device timers run on the hub thread, which makes it safe for an output
+of one device to change another device (eg: a button of one controller lighting LEDs of another).
+
+"""
+
+MESSAGE = object()  # Event marker of a received message
+
+
+class Hub:
+    def __init__(self, devices=None, poll_interval=0.001, check_interval=1, dispatcher=None, clock=None):
+        """
+        Event loop for several devices
+
+        Example use:
+        hub = Hub([DDJ_SB(), Device('VI61:VI61 VI61')])
+        hub.run()
+
+        :param devices: List of midi.device Device instances
+        :param poll_interval: Seconds between polls of devices whose input port does not support listeners
+        :param check_interval: Seconds between checks of the device connections
+        :param dispatcher: midi.dispatcher OutputDispatcher shared by the devices, or None to execute outputs inline
+        :param clock: midi2control.clock Clock of the timers (defaults to the wall clock)
+        """
+        self.clock = clock or CLOCK
+        self.poll_interval = poll_interval
+        self.check_interval = check_interval
+        self.dispatcher = dispatcher
+
+        self.devices = list()
+        self.polled = list()  # Devices without listener support
+        self.events = queue.SimpleQueue()
+        self.timers = list()  # heap of TimerHandle
+        self.timer_lock = threading.Lock()
+        self.next_check = 0
+        self.running = False
+
+        for device in devices or list():
+            self.add_device(device)
+
+    def add_device(self, device):
+        """
+        Add a device to the event loop
+
+        :param device: midi.device Device instance
+        :return: self to allow method chaining
+        """
+        device.scheduler = self
+        if self.dispatcher is not None:
+            device.dispatcher = self.dispatcher
+        if not device.listen(self.receive):
+            self.polled.append(device)
+        self.devices.append(device)
+        device.check_sync()
+        logging.info(f'Device {device} added to hub')
+        return self
+
+    def remove_device(self, device):
+        """
+        Remove a device from the event loop
+
+        :param device: midi.device Device instance
+        :return: None
+        """
+        device.listen(None)
+        device.scheduler = None
+        self.devices.remove(device)
+        if device in self.polled:
+            self.polled.remove(device)
+
+    def receive(self, device, msg):
+        """
+        Device listener queuing a message for the event loop. Called from the MIDI backend thread
+
+        :param device: midi.device Device which received the message
+        :param msg: mido message received from the device
+        :return: None
+        """
+        self.events.put((MESSAGE, (device, msg)))
+
+    def call_soon(self, func, *args):
+        """
+        Execute a function on the event loop as soon as possible. Safe to call from any thread
+
+        :param func: function to execute
+        :param args: un-named arguments of the function
+        :return: None
+        """
+        self.events.put((func, args))
+
+    def call_later(self, delay, func, *args):
+        """
+        Execute a function on the event loop after a delay. Safe to call from any thread
+
+        :param delay: Seconds to wait
+        :param func: function to execute
+        :param args: un-named arguments of the function
+        :return: TimerHandle which can be cancelled with cancel()
+        """
+        handle = TimerHandle(self.clock.monotonic() + delay, func, args)
+        with self.timer_lock:
+            heapq.heappush(self.timers, handle)
+        self.events.put((None, None))  # Wake up the loop to recalculate its timeout
+        return handle
+
+    def run_timers(self):
+        """
+        Execute the functions which are due
+
+        :return: Seconds until the next function is due, or None if there are none
+        """
+        while True:
+            with self.timer_lock:
+                if not self.timers:
+                    return None
+                handle = self.timers[0]
+                wait = handle.when - self.clock.monotonic()
+                if wait > 0:
+                    return wait
+                heapq.heappop(self.timers)
+            if not handle.cancelled:
+                handle.func(*handle.args)
+
+    def check_connections(self):
+        """
+        Reconnect devices which are no longer listed
+
+        :return: None
+        """
+        for device in self.devices:
+            device.check_connection()
+
+    def run_once(self, timeout=None):
+        """
+        Execute one iteration of the event loop, waiting for messages if there is nothing to do
+
+        :param timeout: Maximum seconds to wait (defaults to the check_interval)
+        :return: None
+        """
+        now = self.clock.monotonic()
+        if now >= self.next_check:
+            self.check_connections()
+            self.next_check = now + self.check_interval
+
+        wait = min(filter(lambda w: w is not None, (self.run_timers(),
+                                                     self.check_interval if timeout is None else timeout,
+                                                     self.poll_interval if self.polled else None)))
+
+        try:
+            events = [self.events.get(timeout=max(0, wait))]
+        except queue.Empty:
+            events = list()
+        # Only handle events already queued, so timers and polled devices are not starved by a message storm
+        for _ in range(self.events.qsize()):
+            events.append(self.events.get_nowait())
+        messages = dict()  # Messages keyed by device, dispatched together to allow prioritisation
+        for func, args in events:
+            if func is MESSAGE:
+                messages.setdefault(args[0], list()).append(args[1])
+            elif func is not None:
+                func(*args)
+
+        for device in self.polled:
+            messages.setdefault(device, list()).extend(device.pending())
+
+        for device, msgs in messages.items():
+            device.dispatch_batch(msgs)
+
+    def run(self):
+        """
+        Blocking method to run the event loop until stop() is called
+
+        :return: None
+        """
+        self.running = True
+        while self.running:
+            self.run_once()
+
+    def stop(self):
+        """
+        Stop the event loop. Safe to call from any thread, eg: from an output
+        :return: None
+        """
+        self.running = False
+        self.events.put((None, None))
@@ -1,11 +1,101 @@
 import logging
+import asyncio
+import contextlib
 import copy
+import inspect
+import threading
+
+from midi2control.metrics import output_error
+from midi2control.midi.curves import shared_tables
+from midi2control.midi.breaker import CLOSED
 
 """
 Mappings to associate with a device control (MIDI signal)
 
 """
 
+_tasks = set()  # Running asyncio output tasks (a reference is needed until they are done)
+_building = threading.local()  # Outputs without a device are suppressed while set, see suppress_outputs()
+
+
+@contextlib.contextmanager
+def suppress_outputs():
+    """
+    Skip the outputs mappings trigger without a device (eg: in their constructor or add_output()) within the block,
+    used while building a configuration to reload so that new mappings do not change the outputs before their state
+    is carried over. The skipped outputs are kept in the initialise_outputs attribute of the mapping, for
+    Device.apply_reload() to initialise those of new or changed mappings
+
+    :return: context manager
+    """
+    previous = getattr(_building, 'suppress', False)
+    _building.suppress = True
+    try:
+        yield
+    finally:
+        _building.suppress = previous
+
+
+def run_awaitable(awaitable, device=None, output=None, state=None, msg=None):
+    """
+    Run the result of an async def output function.
+
+    Within a running asyncio event loop, the output becomes a task so it runs concurrently with other outputs and the
+    input handling, limited by the device output_semaphore. Without a running loop it is run to completion.
+    If the output is given and the device has midi.breaker Breakers, its failure or success is recorded by its
+    circuit breaker once it completes.
+
+    :param awaitable: Result of the output function
+    :param device: midi.device Device associated with the mapping
+    :param output: Output function which returned the awaitable, or None
+    :param state: Object passed to the output as mapping
+    :param msg: mido message received from the device
+    :return: asyncio Task or None if run to completion
+    """
+    breakers = getattr(device, 'breakers', None) if output is not None else None
+
+    async def bounded():
+        semaphore = getattr(device, 'output_semaphore', None)
+        if semaphore is None:
+            return await awaitable
+        async with semaphore:
+            return await awaitable
+
+    def finished(error):
+        if error is not None:
+            output_error(device)
+            if breakers is None:
+                logging.error(f'Output of device {device} failed: {error!r}')
+            else:
+                breakers.failure(output, error, state, device, msg)
+        elif breakers is not None:
+            breaker = breakers.get(output)
+            if breaker is not None and breaker.failures:
+                breaker.success()
+
+    def done(task):
+        _tasks.discard(task)
+        if not task.cancelled():
+            finished(task.exception())
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        try:
+            asyncio.run(bounded())
+        except Exception as e:
+            if breakers is None:
+                raise
+            finished(e)
+        else:
+            finished(None)
+        return None
+    task = loop.create_task(bounded())
+    _tasks.add(task)
+    task.add_done_callback(done)
+    return task
+
+
 def map_copy(maps):
     """
     Copies a mapping or list of mappings.
@@ -16,10 +106,16 @@ def map_copy(maps):
     :param maps: MidiMap or list of MidiMap instances
     :return: Copy of the MidiMap or list of MidiMap instances
     """
-    return [copy.deepcopy(m) for m in maps] if isinstance(maps, list) else copy.deepcopy(maps)
+    tables = shared_tables()  # Compiled lookup tables are shared, not copied
+    return [copy.deepcopy(m, dict(tables)) for m in maps] if isinstance(maps, list) else copy.deepcopy(maps, tables)
 
 
 class MidiMap:
+
+    policy = None  # Output queue policy when the device uses a midi.dispatcher OutputDispatcher (None for its default)
+    priority = None  # midi.dispatcher EDGE or CONTINUOUS (None to derive from the message type)
+    state_attributes = ('previous_state', 'current_state')  # Kept when the mapping configuration is reloaded
+
     def __init__(self, name, typ=None, channel=None, control=None, note=None, outputs=None, description=None,
                  initial_state=None, radio=None):
         """
@@ -69,10 +165,26 @@ class MidiMap:
         :param state: New current_state
         :return: None
         """
-        logging.debug(f'Setting {self} to {state}')
         self.previous_state = self.current_state
         self.current_state = state
-        logging.debug(f'Set {self} from {self.previous_state} to {self.current_state}')
+        logging.debug('Set %s from %s to %s', self, self.previous_state, self.current_state)
+
+    def set_batch(self, states):
+        """
+        Set the state after a block of messages calculated at once (see midi.batch)
+        :param states: numpy array of the current_state before the block followed by the state after each message
+        :return: None
+        """
+        self.previous_state, self.current_state = states[-2:].tolist()
+
+    def reconfigure(self, mapping):
+        """
+        Take over the configuration (channels, outputs etc) of another mapping of the same class, keeping the state
+
+        :param mapping: midi.mapping MidiMap instance with the new configuration
+        :return: None
+        """
+        self.__dict__.update({k: v for k, v in mapping.__dict__.items() if k not in self.state_attributes})
 
     def reset(self):
         """
@@ -120,17 +232,36 @@ class MidiMap:
     def add_output(self, func, initialise=True):
         """
         Add an output function to execute when message received
-        :param func: function which accepts 3 arguments: mapping object, device (may be None) and message (may be None)
+        :param func: function which accepts 3 arguments: mapping object, device (may be None) and message (may be None).
+        This may be an async def function, which runs as a task when the device is run in an asyncio event loop
         :param initialise: (bool) Whether to trigger the output after adding it
         :return: self to allow method chaining
         """
         self.outputs.append(func)
         # Initiate output with current value
         if initialise:
-            func(self)
+            self.initialise([func])
 
         return self
 
+    def initialise(self, outputs, device=None):
+        """
+        Trigger output functions with the current state, eg: when they are added.
+        Within suppress_outputs() they are kept in initialise_outputs instead
+
+        :param outputs: list of output functions of this mapping
+        :param device: midi.device Device associated with this mapping
+        :return: None
+        """
+        if getattr(_building, 'suppress', False):
+            pending = self.__dict__.setdefault('initialise_outputs', list())
+            pending.extend(func for func in outputs if func not in pending)
+            return
+        for func in outputs:
+            result = func(self, device, None)
+            if inspect.isawaitable(result):
+                run_awaitable(result, device)
+
     def output(self, device=None, msg=None):
         """
         Trigger all configured output functions
@@ -139,7 +270,55 @@ class MidiMap:
         :param msg: mido message received from the device
         :return:
         """
-        logging.info(f'{self} from Device {device if device else "(no device)"} '
-                     f'triggered by message {msg or "(no message)"}')
+        # Arguments formatted only if debug logging is enabled, as this runs for every message
+        logging.debug('%s from Device %s triggered by message %s', self, device if device else '(no device)',
+                      msg or '(no message)')
+        if device is None and getattr(_building, 'suppress', False):
+            self.initialise(self.outputs)
+            return
+        state_log = getattr(device, 'state_log', None)
+        if state_log is not None:
+            state_log.record(self, device)
+        if getattr(device, 'syncing', False):
+            device.absorb(self, msg)
+            return
+        bridge = getattr(device, 'bridge', None)
+        if bridge is not None:
+            bridge.send(self, device)
+        dispatcher = getattr(device, 'dispatcher', None)
+        if dispatcher is not None:
+            dispatcher.submit(self, device, msg)
+        else:
+            self.execute(self, device, msg)
+
+    def execute(self, state, device=None, msg=None):
+        """
+        Execute all configured output functions. If the device has midi.breaker Breakers, a failing output
+        does not stop the others and is skipped while its circuit breaker is open
+
+        :param state: Object passed to the outputs as mapping, this mapping or a snapshot of its state
+        :param device: midi.device Device associated with this mapping
+        :param msg: mido message received from the device
+        :return: None
+        """
+        profiler = getattr(device, 'profiler', None)
+        breakers = getattr(device, 'breakers', None)
         for output in self.outputs:
-            output(self, device, msg)
+            breaker = breakers.get(output) if breakers is not None else None
+            if breaker is not None and breaker.state != CLOSED:
+                continue  # Output failing, retried by its breaker
+            try:
+                if profiler is None:
+                    result = output(state, device, msg)
+                else:
+                    result = profiler.output(output, state, device, msg)
+            except Exception as e:
+                output_error(device)
+                if breakers is None:
+                    raise
+                breakers.failure(output, e, state, device, msg)
+                continue
+            if inspect.isawaitable(result):
+                run_awaitable(result, device, output, state, msg)  # Recorded by the breaker once completed
+            elif breaker is not None and breaker.failures:
+                breaker.success()
\ No newline at end of file
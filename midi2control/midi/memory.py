@@ -0,0 +1,77 @@
+from collections import deque
+import mido
+
+"""
+In memory MIDI port, eg: to drive a device without hardware in benchmarks and soak tests.
+
+The port behaves like a mido rtmidi port: messages fed to it are delivered as bytes to the callback set by the
+device, exactly as received from a controller, and LED messages sent to it are counted.
+
+    port = MemoryPort('PIONEER DDJ-SB:PIONEER')
+    ddj = DDJ_SB(ports=(port, port))
+    port.feed(b'\\x90\\x0b\\x7f')
+    ddj.check_inputs()
+
+"""
+
+
+class MemoryBackend:
+    def __init__(self, port):
+        """
+        Stand-in for the rtmidi object of a mido port (the _rt attribute)
+
+        :param port: MemoryPort
+        """
+        self.port = port
+        self.callback = None
+        self.data = None
+
+    def set_callback(self, func, data=None):
+        self.callback = func
+        self.data = data
+
+    def cancel_callback(self):
+        self.callback = None
+
+    def ignore_types(self, sysex=True, timing=True, active_sense=True):
+        pass
+
+    def send_message(self, frame):
+        self.port.sent += 1
+        self.port.recent.append(bytes(frame))
+
+
+class MemoryPort:
+    def __init__(self, name='memory', keep=16):
+        """
+        :param name: (str) Port name
+        :param keep: (int) Number of sent messages kept in recent (older ones are only counted)
+        """
+        self.name = name
+        self._rt = MemoryBackend(self)
+        self.queue = deque()  # Messages fed while no callback is set
+        self.sent = 0
+        self.recent = deque(maxlen=keep)
+        self.closed = False
+
+    def feed(self, data):
+        """
+        Receive a message from the 'controller'
+
+        :param data: MIDI message bytes
+        :return: None
+        """
+        if self._rt.callback is not None:
+            self._rt.callback((data, 0.0), self._rt.data)
+        else:
+            self.queue.append(mido.Message.from_bytes(data))
+
+    def iter_pending(self):
+        while self.queue:
+            yield self.queue.popleft()
+
+    def send(self, msg):
+        self._rt.send_message(bytes(msg.bytes()))
+
+    def close(self):
+        self.closed = True
@@ -0,0 +1,85 @@
+import mido
+
+"""
+Lightweight MIDI message decoded directly from the message bytes.
+
+Mappings only read a few attributes of a message (type, channel, note/control and velocity/value). These are
+read directly from the status and data bytes. A full mido message is only created if any other attribute is used,
+eg: by an output function.
+
+"""
+
+TYPES = {0x80: 'note_off', 0x90: 'note_on', 0xA0: 'polytouch', 0xB0: 'control_change',
+         0xC0: 'program_change', 0xD0: 'aftertouch', 0xE0: 'pitchwheel'}
+
+
+class RawMessage:
+    __slots__ = ('data', '_msg')
+
+    def __init__(self, data):
+        """
+        :param data: bytes of a channel message, eg: b'\x90\x05\x7f'
+        """
+        self.data = data
+        self._msg = None
+
+    @property
+    def type(self):
+        return TYPES.get(self.data[0] & 0xF0)
+
+    @property
+    def channel(self):
+        return self.data[0] & 0x0F
+
+    @property
+    def note(self):
+        return self.data[1]
+
+    @property
+    def control(self):
+        return self.data[1]
+
+    @property
+    def velocity(self):
+        return self.data[2]
+
+    @property
+    def value(self):
+        return self.data[2]
+
+    def bytes(self):
+        """
+        :return: list of message bytes, as mido messages
+        """
+        return list(self.data)
+
+    def message(self):
+        """
+        :return: mido message with the same content, created on first use
+        """
+        if self._msg is None:
+            self._msg = mido.Message.from_bytes(self.data)
+        return self._msg
+
+    def __getattr__(self, item):
+        return getattr(self.message(), item)
+
+    def __eq__(self, other):
+        if isinstance(other, (bytes, bytearray)):
+            return bytes(self.data) == other
+        to_bytes = getattr(other, 'bytes', None)
+        if not callable(to_bytes):
+            return NotImplemented
+        return bytes(self.data) == bytes(to_bytes())
+
+    __hash__ = None
+
+    def __str__(self):
+        if self.data[0] & 0xF0 == 0xB0:
+            return f'control_change channel={self.channel} control={self.control} value={self.value} time=0'
+        if self.data[0] & 0xE0 == 0x80:
+            return f'{self.type} channel={self.channel} note={self.note} velocity={self.velocity} time=0'
+        return str(self.message())
+
+    def __repr__(self):
+        return f'RawMessage({bytes(self.data)!r})'
@@ -1,5 +1,6 @@
-import time
-from threading import Thread
+import os
+import threading
+
 from midi2control.midi.mapping import map_copy
 from midi2control.midi.device import Device
 from midi2control.midi.pioneer.pioneer import *
@@ -75,17 +76,36 @@ for r in PADS2:
     r.name = r.name.replace('Deck1', 'Deck2')
     r.channel = 8
 
+# The same layout as a declarative profile, see midi.profile
+PROFILE = os.path.join(os.path.dirname(__file__), 'ddj_sb.json')
+
 ##################################################################################################################
 
 class DDJ_SB(Device):
-    def __init__(self, name='PIONEER DDJ-SB:PIONEER'):
+    def __init__(self, name='PIONEER DDJ-SB:PIONEER', sync_outputs=False, clock=None, ports=None):
+        """
+        Pioneer DDJ-SB with its complete layout configured in the default mode.
+
+        The controller sends the positions of all its controls on connection. These are absorbed into the mapping
+        states in a sync phase without executing outputs; the ready event is set when it is complete.
+
+        :param name: (str) Name of device according to mido device connection
+        :param sync_outputs: (bool) Execute the outputs of each changed mapping once at the end of the sync phase
+        :param clock: midi2control.clock Clock used for waits and timers (defaults to the wall clock)
+        :param ports: (inport, outport) to use instead of the mido ports, eg: midi.memory MemoryPort
+        """
         # NB: Make copy of maps declared above to preserve the originals
         # (otherwise they will also have outputs assigned)
         # We will however use the original MODE_SELECTOR and allow modification and reuse of modes
+        self.animation = 0  # Incremented by each animation, so a newer animation stops the previous one
+        self.animation_timer = None  # Pending timer of the current animation step
+        self.animation_lock = threading.Lock()  # Held while the animation or its timer is replaced
         Device.__init__(self, name=name, midi_maps={None: MODE_SELECTOR + map_copy(BROWSER) + map_copy(MIXER) +
                                                           map_copy(DECK1) + map_copy(DECK2) + map_copy(FX1)
-                                                          + map_copy(FX2) + map_copy(PADS1) + map_copy(PADS2)})
+                                                          + map_copy(FX2) + map_copy(PADS1) + map_copy(PADS2)},
+                        clock=clock, ports=ports)
         # Send DJ.App connected signal - ths will prompt current positions to be broadcast
+        self.sync(outputs=sync_outputs)
         self.outport.send(mido.Message('note_on', channel=11, note=9))
         self.animate()
 
@@ -96,19 +116,36 @@ class DDJ_SB(Device):
         """
 
         def buttons():
-            return [m for m in self.midi_maps.get(self.mode).values() if m.__class__ == Press]
+            return [m for m in self.mode_state.leds if m.__class__ == Press]
 
-        def blink():
-            for i in range(5):
-                for m in buttons():
-                    m.led_on(self)
-                time.sleep(0.5)
-                for m in buttons():
-                    m.led_off(self)
-            # Restore according to current status
+        def leds(on):
             for m in buttons():
-                if m.current_state:
+                if on:
                     m.led_on(self)
+                else:
+                    m.led_off(self)
 
-        # Run in thread to allow continued use of device
-        Thread(target=blink).start()
\ No newline at end of file
+        def restore():
+            # Restore according to current status
+            self.flush_leds(buttons())
+
+        # Blink on and off every half second, then restore. Each step schedules the next as a device timer
+        # (to allow continued use of device), so one timer is pending at a time. A newer animation cancels it
+        steps = [(leds, i % 2 == 0) for i in range(10)] + [(restore, )]
+
+        def step(i):
+            if animation != self.animation:
+                return  # Replaced by a newer animation
+            func, *args = steps[i]
+            func(*args)
+            with self.animation_lock:
+                # Steps run on timer threads, only the current animation may replace the pending timer
+                if animation == self.animation:
+                    self.animation_timer = self.call_later(0.5, step, i + 1) if i + 1 < len(steps) else None
+
+        with self.animation_lock:
+            self.animation += 1
+            animation = self.animation
+            if self.animation_timer is not None:
+                self.animation_timer.cancel()
+            self.animation_timer = self.call_later(0, step, 0)
@@ -1,15 +1,27 @@
 import logging
 from midi2control.midi.mapping import MidiMap
 from midi2control.midi.device import flatten
+from midi2control.midi.curves import compile_table, curve_key, linear, TableAttribute, BITS_14
+from midi2control.midi.dispatcher import LATEST, NEVER_DROP, EDGE, CONTINUOUS
 import mido
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class JogDial(MidiMap):
 
     typ = 'control_change'
+    policy = LATEST
+    priority = CONTINUOUS
+
+    invert = TableAttribute()
+    curve = TableAttribute()
 
     def __init__(self, name, channel, control, description=None, outputs=None, invert=False, max_state=None,
-                 min_state=None, initial_state=0):
+                 min_state=None, initial_state=0, curve=None):
         """
 
         DK-Deck Jog-dial control input.
@@ -24,15 +36,18 @@ class JogDial(MidiMap):
         :param max_state: Limit current_state to this maximum value
         :param min_state: Limit current_state to this minimum value
         :param initial_state: 0 is center 1.0 is full revolution (+ is clockwise)
+        :param curve: Relative curve function applied to the ticks of each message, eg: curves.acceleration()
         """
 
         super().__init__(name=name, typ=self.typ, channel=channel, control=control, outputs=outputs,
                          description=description, initial_state=initial_state)
 
         self.invert = invert
+        self.curve = curve
         self.max_state = max_state
         self.min_state = min_state
 
+        self.compile()
         self.reset()
         self.output()
 
@@ -43,6 +58,15 @@ class JogDial(MidiMap):
         """
         super().reset()
 
+    def compile(self):
+        """
+        Compile the rotation of each possible message value (64 is stationary) into a lookup table
+        :return: None
+        """
+        curve = self.curve or linear
+        sign = -1 if self.invert else 1
+        self.table = compile_table(lambda value: sign * curve(value - 64) / 720, key=('JogDial', sign, curve_key(curve)))
+
     def message(self, device, msg):
         """
         handle a matching MIDI message
@@ -50,10 +74,7 @@ class JogDial(MidiMap):
         :param device: midi.device Device associated with this mapping
         :param msg: mido message received from the device
         """
-        scaled_value = (msg.value - 64) / 720
-        if self.invert:
-            scaled_value = -1 *  scaled_value
-        calculated_position = self.current_state + scaled_value
+        calculated_position = self.current_state + self.table[msg.value]
         if self.max_state is not None and calculated_position > self.max_state:
             calculated_position = self.max_state
         if self.min_state is not None and calculated_position < self.min_state:
@@ -61,12 +82,33 @@ class JogDial(MidiMap):
         self.set(calculated_position)
         self.output(device, msg)
 
+    def batch_states(self, numbers, values):
+        """
+        States after each message of a block, calculated at once with numpy (see midi.batch)
+
+        :param numbers: numpy array of the control numbers of the messages
+        :param values: numpy array of the values of the messages
+        :return: numpy bool array of the messages which output and numpy array of the states they output,
+        or None if the messages must be handled one by one
+        """
+        if self.max_state is not None or self.min_state is not None:
+            return None  # Limits apply to each message
+        steps = numpy.frombuffer(self.table, dtype=self.table.typecode)[values]
+        states = numpy.cumsum(numpy.concatenate(((self.current_state, ), steps)))  # Added in order, as message()
+        self.set_batch(states)
+        return numpy.ones(len(values), dtype=bool), states[1:]
+
 
 class Browser(MidiMap):
 
     typ = 'control_change'
+    policy = LATEST
+    priority = CONTINUOUS
+
+    invert = TableAttribute()
+    curve = TableAttribute()
 
-    def __init__(self, name, channel, control, description=None, outputs=None, invert=False):
+    def __init__(self, name, channel, control, description=None, outputs=None, invert=False, curve=None):
         """
 
         Manages current position as integer + / - from 0 depending on clock-/anticlockwise
@@ -77,7 +119,7 @@ class Browser(MidiMap):
         :param description: (str) Detailed description of the mapping
         :param outputs: List of mapping output functions which should be executed on mapping input
         :param invert: (bool) if False, clockwise increases the state, if True, clockwise will reduce the state value
-        :param outputs: List of mapping output functions which should be executed on mapping input
+        :param curve: Relative curve function applied to the ticks of each message, eg: curves.acceleration()
 
         """
 
@@ -85,7 +127,9 @@ class Browser(MidiMap):
                          outputs=outputs, initial_state=0)
 
         self.invert = invert
+        self.curve = curve
 
+        self.compile()
         self.reset()
         self.output()
 
@@ -96,6 +140,17 @@ class Browser(MidiMap):
         """
         super().reset()
 
+    def compile(self):
+        """
+        Compile the integer steps of each possible message value into a lookup table.
+        Values below 98 are clockwise steps, the others anticlockwise
+        :return: None
+        """
+        curve = self.curve or linear
+        sign = -1 if self.invert else 1
+        self.table = compile_table(lambda value: sign * round(curve(value if value < 98 else value - 128)),
+                                   typecode='l', key=('Browser', sign, curve_key(curve)))
+
     def message(self, device, msg):
         """
         handle a matching MIDI message
@@ -103,18 +158,37 @@ class Browser(MidiMap):
         :param device: midi.device Device associated with this mapping
         :param msg: mido message received from the device
         """
-        if msg.value < 98:  # Clockwise
-            self.set(self.current_state + (-msg.value if self.invert else msg.value))
-        else:
-            self.set(self.current_state + ((128-msg.value) if self.invert else -(128-msg.value)))
+        self.set(self.current_state + self.table[msg.value])
         self.output(device, msg)
 
+    def batch_states(self, numbers, values):
+        """
+        States after each message of a block, calculated at once with numpy (see midi.batch)
+
+        :param numbers: numpy array of the control numbers of the messages
+        :param values: numpy array of the values of the messages
+        :return: numpy bool array of the messages which output and numpy array of the states they output,
+        or None if the messages must be handled one by one
+        """
+        steps = numpy.frombuffer(self.table, dtype=self.table.typecode)[values]
+        states = numpy.cumsum(numpy.concatenate(((self.current_state, ), steps)))
+        self.set_batch(states)
+        return numpy.ones(len(values), dtype=bool), states[1:]
+
 
 class Slide(MidiMap):
 
     typ = 'control_change'
+    policy = LATEST
+    priority = CONTINUOUS
+    state_attributes = MidiMap.state_attributes + ('coarse_value', 'fine_value')
+
+    invert = TableAttribute()
+    center = TableAttribute()
+    curve = TableAttribute()
 
-    def __init__(self, name, channel, control, description=None, outputs=None, invert=False, center=False, step=None):
+    def __init__(self, name, channel, control, description=None, outputs=None, invert=False, center=False, step=None,
+                 curve=None):
         """
 
         :param name: (str) Name used to refer or access the mapping
@@ -125,6 +199,7 @@ class Slide(MidiMap):
         :param invert: (bool) if False, clockwise increases the state, if True, clockwise will reduce the state value
         :param center: If True, center position of slider is set to 0 (with +1 and -1 at extents).
         :param step: Difference between self.previous_state and self.current_state, above which outputs will be triggered
+        :param curve: Absolute curve function applied to the position (0-1.0), eg: curves.logarithmic()
         """
 
         MidiMap.__init__(self, name=name, typ=self.typ, channel=channel, control=control,
@@ -132,6 +207,7 @@ class Slide(MidiMap):
 
         self.invert = invert
         self.center = center
+        self.curve = curve
         self.step = step
 
         # Create list of corresponding coarse and fine control values
@@ -141,6 +217,7 @@ class Slide(MidiMap):
         self.coarse_value = None
         self.fine_value = None
 
+        self.compile()
         self.reset()
         self.output()
 
@@ -153,6 +230,25 @@ class Slide(MidiMap):
         self.coarse_value = None
         self.fine_value = None
 
+    def compile(self):
+        """
+        Compile the position of each possible 14-bit coarse/fine value into a lookup table
+        :return: None
+        """
+        curve = self.curve or linear
+
+        def position(value):
+            calculated_position = value / 16383
+            if self.invert:
+                calculated_position = 1 - calculated_position
+            calculated_position = curve(calculated_position)
+            if self.center:
+                calculated_position = 2 * (calculated_position - 0.5)
+            return calculated_position
+
+        self.table = compile_table(position, bits=BITS_14,
+                                   key=('Slide', bool(self.invert), bool(self.center), curve_key(curve)))
+
     def message(self, device, msg):
         """
         handle a matching MIDI message
@@ -166,11 +262,7 @@ class Slide(MidiMap):
             self.fine_value = msg.value
         if self.coarse_value is not None and self.fine_value is not None:  # Both have been sent
 
-            calculated_position = (self.coarse_value * 128 + self.fine_value) / 16383
-            if self.invert:
-                calculated_position = 1 - calculated_position
-            if self.center:
-                calculated_position = 2 * (calculated_position - 0.5)
+            calculated_position = self.table[self.coarse_value * 128 + self.fine_value]
 
             # Reset values
             self.coarse_value = None
@@ -183,19 +275,44 @@ class Slide(MidiMap):
             else:
                 logging.debug(f'{self} output change below step value, outputs not executed')
 
+    def batch_states(self, numbers, values):
+        """
+        States after each message of a block, calculated at once with numpy (see midi.batch)
+
+        :param numbers: numpy array of the control numbers of the messages
+        :param values: numpy array of the values of the messages
+        :return: numpy bool array of the messages which output and numpy array of the states they output,
+        or None if the messages must be handled one by one
+        """
+        if self.step or self.coarse_value is not None or self.fine_value is not None or len(values) % 2:
+            return None
+        coarse = numpy.isin(numbers, self.coarse_control)
+        if not (coarse[0::2] != coarse[1::2]).all():
+            return None  # Not pairs of a coarse and a fine value
+        coarse_values = numpy.where(coarse[0::2], values[0::2], values[1::2]).astype(numpy.int64)
+        fine_values = numpy.where(coarse[0::2], values[1::2], values[0::2])
+        positions = numpy.frombuffer(self.table, dtype=self.table.typecode)[coarse_values * 128 + fine_values]
+        self.set_batch(numpy.concatenate(((self.current_state, ), positions)))
+        emitted = numpy.zeros(len(values), dtype=bool)
+        emitted[1::2] = True  # Second message of each pair
+        return emitted, positions
+
 
 class Rotate(Slide):
     """
     Clone of Slide. Functionally the same, but named to match Pioneer terminology
     """
-    def __init__(self, name, channel, control, description=None, outputs=None, invert=False, center=False, step=None):
+    def __init__(self, name, channel, control, description=None, outputs=None, invert=False, center=False, step=None,
+                 curve=None):
         Slide.__init__(self, name=name, channel=channel, control=control, description=description, outputs=outputs,
-                       invert=invert, center=center, step=step)
+                       invert=invert, center=center, step=step, curve=curve)
 
 
 class Press(MidiMap):
 
     typ = 'note_on'
+    policy = NEVER_DROP
+    priority = EDGE
 
     def __init__(self, name, channel, note, toggle=False, description=None, outputs=None, radio=None, initial_state=False):
         """
@@ -216,6 +333,8 @@ class Press(MidiMap):
                          description=description, outputs=outputs, radio=radio, initial_state=initial_state)
 
         self.toggle = toggle
+        self._led_key = None
+        self._led_frames = None
 
         self.reset()
         self.output()
@@ -287,28 +406,34 @@ class Press(MidiMap):
             self.led_off(device)
             self.output(device, msg)
 
+    def led_frames(self):
+        """
+        Prebuilt note_on messages to turn the button LEDs on and off, rebuilt if the channel or note is changed
+
+        :return: list of (channel, note, on message bytes, off message bytes)
+        """
+        if self._led_key != (self.channel, self.note):
+            self._led_key = (self.channel, self.note)
+            self._led_frames = [(channel, note, bytes((0x90 | channel, note, 127)), bytes((0x90 | channel, note, 0)))
+                                for channel in flatten(self.channel) for note in flatten(self.note)]
+        return self._led_frames
+
     def led_on(self, device):
         """
-        Turn the button LED o using the outgoing MIDI channel to the device
+        Turn the button LED on using the outgoing MIDI channel to the device
 
         :param device: midi.device Device to send to
         :return: None
         """
-        for channel in flatten(self.channel):
-            for note in flatten(self.note):
-                device.outport.send(mido.Message('note_on', channel=channel, note=note, velocity=127))
+        for channel, note, on, off in self.led_frames():
+            device.led(channel, note, 127, on)
 
     def led_off(self, device):
         """
-        Turn the button LED o using the outgoing MIDI channel to the device
+        Turn the button LED off using the outgoing MIDI channel to the device
 
         :param device: midi.device Device to send to
         :return: None
         """
-        for channel in flatten( self.channel):
-            for note in flatten(self.note):
-                device.outport.send(mido.Message('note_on', channel=channel, note=note, velocity=0))
-
-
-
-
+        for channel, note, on, off in self.led_frames():
+            device.led(channel, note, 0, off)
@@ -0,0 +1,315 @@
+import logging
+import hashlib
+import importlib
+import json
+import os
+import pickle
+import sys
+
+from midi2control.midi.mapping import MidiMap
+from midi2control.midi.device import ModeState
+from midi2control.midi.pioneer.pioneer import JogDial, Browser, Slide, Rotate, Press
+
+"""
+Declarative device profiles.
+
+A profile (JSON or TOML) describes the mappings of each mode and their output bindings. It is compiled into an
+artifact containing the mappings with their initial state and the dispatch table of each mode. The artifact is cached
+on disk, keyed by the hash of the profile content and of the source code of the mapping classes, so later starts load
+it instead of creating and copying the mappings. Cached artifacts are pickled objects, so they are only loaded from
+files of the current user which nobody else can write.
+
+Profile layout (JSON):
+
+{
+  "device": {"name": "PIONEER DDJ-SB:PIONEER"},
+  "groups": {
+    "DECK1": [{"class": "Press", "name": "PLAY/PAUSE:Deck1", "channel": 0, "note": [11, 71]},
+              {"class": "Slide", "name": "TEMPO:Deck1", "channel": 0, "control": [[0, 32], [5, 37]], "center": true}]
+  },
+  "modes": {
+    "default": [{"group": "DECK1"},
+                {"group": "DECK1", "replace": {"Deck1": "Deck2", "Pads1": "Pads2"}, "set": {"channel": 1}}],
+    "Gaming": [{"group": "DECK1"}]
+  },
+  "resources": {"light": {"factory": "midi2control.control.light:ElgatoLight", "kwargs": {"address": "192.168.1.132"}}},
+  "outputs": [
+    {"map": "TEMPO:Deck1", "output": "resource:light.set_brightness"},
+    {"map": "PLAY/PAUSE:Deck1", "mode": "Gaming", "output": "midi2control.control.gui:press", "args": ["space"]},
+    {"map": "BROWSE:ROTATE", "output": "device:browse_mode"},
+    {"map": "BROWSE:PRESS", "output": "midi2control.control:output",
+     "args": [{"device": "change_mode"}], "kwargs": {"mode_index": {"map": "BROWSE:ROTATE"}}}
+  ]
+}
+
+The mode "default" is the default (None) mode of the device. Mapping classes are the names below or "module:Class".
+Outputs are "device:<method>", "resource:<name>.<method>" or "module:function" factories called with args and kwargs.
+Argument values {"map": name}, {"device": method} and {"resource": name} refer to mappings, device methods
+and resources.
+
+"""
+
+ARTIFACT_VERSION = 2
+DEFAULT_MODE = 'default'
+CLASSES = {c.__name__: c for c in (MidiMap, JogDial, Browser, Slide, Rotate, Press)}
+_package_source = None  # Hash of the package source code, see package_source()
+
+
+def resolve(path):
+    """
+    Import an object from a 'module:name' path
+
+    :param path: (str) eg: 'midi2control.control.gui:press'
+    :return: object
+    """
+    module, _, name = path.partition(':')
+    obj = importlib.import_module(module)
+    for attr in name.split('.'):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def read_profile(path):
+    """
+    Read the content of a profile file
+
+    :param path: Path of a .json or .toml profile
+    :return: (bytes) profile content
+    """
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def parse_profile(content, path=''):
+    """
+    Parse profile content
+
+    :param content: (bytes) profile content
+    :param path: Path of the profile (the .toml suffix selects TOML)
+    :return: dict
+    """
+    if str(path).endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        return tomllib.loads(content.decode())
+    return json.loads(content)
+
+
+def tuples(value, depth=0):
+    """
+    Convert nested lists (eg: coarse/fine control pairs) to tuples, as used by the mapping classes
+
+    :param value: argument value
+    :param depth: nesting depth
+    :return: argument value
+    """
+    if isinstance(value, list):
+        items = [tuples(v, depth + 1) for v in value]
+        return tuple(items) if depth else items
+    return value
+
+
+def create_map(spec):
+    """
+    Create a mapping from its profile description
+
+    :param spec: dict with class, name and the mapping arguments
+    :return: midi.mapping MidiMap instance
+    """
+    spec = dict(spec)
+    name = spec.pop('class', 'MidiMap')
+    cls = CLASSES.get(name) or resolve(name)
+    kwargs = {k: tuples(v) for k, v in spec.items()}
+    if issubclass(cls, Slide) and isinstance(kwargs.get('control'), list) and \
+            all(isinstance(c, int) for c in kwargs['control']):
+        kwargs['control'] = tuple(kwargs['control'])  # Single coarse/fine pair
+    if cls is MidiMap and 'type' in kwargs:
+        kwargs['typ'] = kwargs.pop('type')
+    return cls(**kwargs)
+
+
+def compile_profile(profile):
+    """
+    Compile a parsed profile into an artifact: the mappings of each mode with their initial state (without outputs),
+    the entry state (dispatch table, LEDs and radio groups) of each mode and the device, resource and output descriptions.
+
+    :param profile: dict of the parsed profile
+    :return: dict artifact
+    """
+    groups = profile.get('groups', dict())
+    midi_maps = dict()
+    for mode_name, entries in profile.get('modes', dict()).items():
+        mode = None if mode_name == DEFAULT_MODE else mode_name
+        midi_maps[mode] = dict()
+        for entry in entries:
+            if 'group' in entry:
+                for spec in groups[entry['group']]:
+                    spec = dict(spec, **entry.get('set', dict()))
+                    for old, new in entry.get('replace', dict()).items():
+                        for key in ('name', 'radio'):
+                            if isinstance(spec.get(key), str):
+                                spec[key] = spec[key].replace(old, new)
+                    m = create_map(spec)
+                    midi_maps[mode][m.name] = m
+            else:
+                m = create_map(entry)
+                midi_maps[mode][m.name] = m
+
+    return {'version': ARTIFACT_VERSION,
+            'device': profile.get('device', dict()),
+            'midi_maps': midi_maps,
+            'modes': {mode: ModeState(maps.values()) for mode, maps in midi_maps.items()},
+            'resources': profile.get('resources', dict()),
+            'outputs': profile.get('outputs', list())}
+
+
+def specs(profile):
+    """
+    :param profile: dict of the parsed profile
+    :return: generator of the mapping descriptions of the profile
+    """
+    for group in profile.get('groups', dict()).values():
+        yield from group
+    for entries in profile.get('modes', dict()).values():
+        yield from (entry for entry in entries if 'group' not in entry)
+
+
+def package_source():
+    """
+    :return: (bytes) Hash of the source code of the midi2control package, computed once per process (the imported
+    code does not change while it runs)
+    """
+    global _package_source
+    if _package_source is None:
+        package = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha256()
+        for file in sorted(os.path.join(root, name) for root, _, names in os.walk(package)
+                           for name in names if name.endswith('.py')):
+            with open(file, 'rb') as f:
+                digest.update(file.encode() + b'\x00' + f.read())
+        _package_source = digest.digest()
+    return _package_source
+
+
+def fingerprint(profile):
+    """
+    Hash of the source code the artifact of a profile depends on: the midi2control package and the modules of the
+    mapping classes from other packages (by modification time and size), so that artifacts of modified classes are
+    not loaded
+
+    :param profile: dict of the parsed profile
+    :return: (bytes) digest
+    """
+    digest = hashlib.sha256(package_source())
+    for name in sorted({spec.get('class', 'MidiMap') for spec in specs(profile)} - set(CLASSES)):
+        file = sys.modules[resolve(name).__module__].__file__
+        info = os.stat(file)
+        digest.update(f'{file}:{info.st_mtime_ns}:{info.st_size}'.encode())
+    return digest.digest()
+
+
+def cache_path(content, cache_dir=None, source=b''):
+    """
+    Path of the cached artifact of a profile
+
+    :param content: (bytes) profile content
+    :param cache_dir: Directory of cached artifacts (defaults to ~/.cache/midi2control)
+    :param source: (bytes) fingerprint() of the source code of the mapping classes
+    :return: path
+    """
+    cache_dir = cache_dir or os.path.join(os.path.expanduser('~'), '.cache', 'midi2control')
+    key = hashlib.sha256(content + source + f'{ARTIFACT_VERSION}:{sys.version_info[:2]}'.encode()).hexdigest()
+    return os.path.join(cache_dir, f'{key}.pickle')
+
+
+def trusted(path):
+    """
+    :param path: Path of a cached artifact
+    :return: (bool) True if the file and its directory belong to the current user and nobody else can write them
+    """
+    if not hasattr(os, 'getuid'):  # Windows, the user profile directory is private
+        return True
+    for p in (path, os.path.dirname(path)):
+        info = os.stat(p)
+        if info.st_uid != os.getuid() or info.st_mode & 0o022:
+            return False
+    return True
+
+
+def load_artifact(path, cache_dir=None, cache=True):
+    """
+    Load the compiled artifact of a profile, from the cache if available. Otherwise it is compiled and cached.
+
+    :param path: Path of a .json or .toml profile
+    :param cache_dir: Directory of cached artifacts (defaults to ~/.cache/midi2control)
+    :param cache: (bool) Use the cache
+    :return: dict artifact
+    """
+    content = read_profile(path)
+    profile = parse_profile(content, path)
+    cached = cache_path(content, cache_dir, fingerprint(profile))
+    if cache and os.path.exists(cached):
+        try:
+            if not trusted(cached):
+                raise PermissionError('writable by other users')
+            with open(cached, 'rb') as f:
+                artifact = pickle.load(f)
+            if artifact.get('version') == ARTIFACT_VERSION:
+                logging.debug(f'Profile {path} loaded from {cached}')
+                return artifact
+        except Exception as e:
+            logging.warning(f'Cached profile {cached} not loaded: {e}')
+
+    artifact = compile_profile(profile)
+    if cache:
+        try:
+            os.makedirs(os.path.dirname(cached), mode=0o700, exist_ok=True)
+            with os.fdopen(os.open(cached + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as f:
+                pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cached + '.tmp', cached)
+            logging.debug(f'Profile {path} compiled to {cached}')
+        except OSError as e:
+            logging.warning(f'Compiled profile not cached: {e}')
+    return artifact
+
+
+def bind_outputs(device, artifact):
+    """
+    Create the resources and add the outputs described in the artifact to the device mappings
+
+    :param device: midi.device Device with the artifact mappings
+    :param artifact: dict artifact
+    :return: dict of resources keyed by name
+    """
+    resources = dict()
+    for name, spec in artifact['resources'].items():
+        resources[name] = resolve(spec['factory'])(*spec.get('args', list()), **spec.get('kwargs', dict()))
+
+    for binding in artifact['outputs']:
+        mode = binding.get('mode', DEFAULT_MODE)
+        mode = None if mode == DEFAULT_MODE else mode
+
+        def value(v):
+            if isinstance(v, dict) and len(v) == 1:
+                kind, name = next(iter(v.items()))
+                if kind == 'map':
+                    return device.get_map(name, mode)
+                if kind == 'device':
+                    return getattr(device, name)
+                if kind == 'resource':
+                    return resources[name]
+            return v
+
+        kind, _, target = binding['output'].partition(':')
+        if kind == 'device':
+            func = getattr(device, target)
+        elif kind == 'resource':
+            resource, _, method = target.partition('.')
+            func = getattr(resources[resource], method)
+        else:
+            func = resolve(binding['output'])(*[value(v) for v in binding.get('args', list())],
+                                              **{k: value(v) for k, v in binding.get('kwargs', dict()).items()})
+        device.get_map(binding['map'], mode).add_output(func, initialise=binding.get('initialise', True))
+    return resources
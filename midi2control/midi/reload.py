@@ -0,0 +1,104 @@
+import logging
+import os
+import runpy
+
+from midi2control.midi.mapping import suppress_outputs
+
+"""
+Reloading of mapping configuration files at runtime.
+
+A configuration file is a Python script which defines a MIDI_MAPS dict of lists of mappings (keyed by mode name),
+with their outputs added. When the file changes, it is executed again and applied to the device with Device.reload(),
+keeping the connection and the state of existing mappings. The outputs mappings trigger when they are created are
+skipped while the file is executed, the device only initialises those of added mappings and of mappings whose outputs
+changed, in the current mode.
+
+The script can use the following names:
+- device: the midi.device Device the configuration is applied to
+- resource: function to reuse objects such as lights or gamepads across reloads, eg:
+    light = resource('light', ElgatoLight, address='192.168.1.132')
+
+"""
+
+
+class ConfigWatcher:
+    def __init__(self, device, path, interval=1):
+        """
+        Watches a mapping configuration file and reloads it into the device when it changes
+
+        :param device: midi.device Device to configure
+        :param path: Path of the configuration script
+        :param interval: Seconds between checks of the file modification time
+        """
+        self.device = device
+        self.path = path
+        self.interval = interval
+        self.resources = dict()
+        self.mtime = None
+        self.timer = None
+
+    def resource(self, key, factory, *args, **kwargs):
+        """
+        Create an object once and return the same object on later reloads
+
+        :param key: Name of the object
+        :param factory: function or class creating the object
+        :param args: un-named arguments of the factory
+        :param kwargs: named arguments of the factory
+        :return: object
+        """
+        if key not in self.resources:
+            self.resources[key] = factory(*args, **kwargs)
+        return self.resources[key]
+
+    def load(self):
+        """
+        Execute the configuration file and reload the device with its MIDI_MAPS
+
+        :return: (bool) True if the configuration was loaded
+        """
+        try:
+            with suppress_outputs():
+                config = runpy.run_path(self.path, init_globals={'device': self.device, 'resource': self.resource})
+            midi_maps = config['MIDI_MAPS']
+        except Exception as e:
+            logging.exception(f'Configuration {self.path} not loaded, keeping current configuration: {e}')
+            return False
+        self.device.reload(midi_maps)
+        logging.info(f'Configuration {self.path} loaded')
+        return True
+
+    def check(self):
+        """
+        Load the configuration file if it was modified since the last check
+
+        :return: None
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError as e:
+            logging.warning(f'Configuration {self.path} not readable: {e}')
+            mtime = self.mtime
+        if mtime != self.mtime:
+            self.mtime = mtime
+            self.load()
+
+    def start(self):
+        """
+        Load the configuration and check for changes periodically using the device timers
+
+        :return: self to allow method chaining
+        """
+        def tick():
+            self.check()
+            self.timer = self.device.call_later(self.interval, tick)
+        tick()
+        return self
+
+    def stop(self):
+        """
+        Stop checking for changes
+        :return: None
+        """
+        if self.timer is not None:
+            self.timer.cancel()
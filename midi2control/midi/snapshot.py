@@ -0,0 +1,199 @@
+import logging
+import json
+import os
+import threading
+
+"""
+Snapshots of the mapping states for a warm restart.
+
+The state of every mapping (eg: jog dial positions, browser index, toggled buttons) and the mode of each device are
+written periodically to a compact JSON file by a background thread, so the MIDI handling never waits for the disk.
+The file is written to a temporary file and renamed over the previous snapshot, so a crash leaves either the old
+or the new snapshot, never a partial one.
+
+On startup the devices are restored from the snapshot and their button LEDs are sent in one batch:
+
+    snapshots = Snapshotter([ddj], 'midi2control.snapshot')
+    snapshots.restore()
+    snapshots.start()
+
+"""
+
+VERSION = 1
+
+
+def capture(device):
+    """
+    Capture the mode and mapping states of a device
+
+    :param device: midi.device Device
+    :return: dict of the device state
+    """
+    maps = list()
+    for mode, mode_maps in list(device.midi_maps.items()):
+        for name, m in list(mode_maps.items()):
+            maps.append([mode, name, m.__class__.__name__, {a: getattr(m, a, None) for a in m.state_attributes}])
+    return {'mode': device.mode, 'maps': maps}
+
+
+def apply(device, state):
+    """
+    Restore the mode and mapping states of a device captured with capture().
+    Mappings which no longer exist or changed class are skipped. The button LEDs of the mode are then shown.
+
+    :param device: midi.device Device
+    :param state: dict of the device state
+    :return: (int) Number of mappings restored
+    """
+    restored = 0
+    for mode, name, cls, attributes in state['maps']:
+        m = device.midi_maps.get(mode, dict()).get(name)
+        if m is None or m.__class__.__name__ != cls:
+            continue
+        for attribute, value in attributes.items():
+            if attribute in m.state_attributes:
+                setattr(m, attribute, value)
+        restored += 1
+
+    if state['mode'] in device.midi_maps and state['mode'] != device.mode:
+        device.mode = state['mode']
+        device.update_filter()
+    device.flush_leds()
+    return restored
+
+
+def write(path, data):
+    """
+    Write a snapshot atomically: to a temporary file which replaces the previous snapshot
+
+    :param path: Path of the snapshot file
+    :param data: (bytes) Snapshot content
+    :return: None
+    """
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class Snapshotter:
+    def __init__(self, devices, path, interval=5):
+        """
+        Writes snapshots of the device states periodically in a background thread
+
+        :param devices: List of midi.device Device instances (keyed by their name in the snapshot)
+        :param path: Path of the snapshot file
+        :param interval: Seconds between snapshots. A snapshot is only written if the states changed
+        """
+        self.devices = devices
+        self.path = path
+        self.interval = interval
+        self.last = None  # Content of the last snapshot written
+        self.skipped = set()  # Keys of the states left out of the snapshot, see serialisable()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def snapshot(self):
+        """
+        Write a snapshot if the states changed since the last one
+
+        :return: (bool) True if a snapshot was written
+        """
+        try:
+            devices = {d.name: capture(d) for d in self.devices}
+        except RuntimeError as e:
+            # Mappings changed while capturing them (eg: reloaded), captured at the next interval
+            logging.debug(f'Snapshot skipped: {e}')
+            return False
+        try:
+            data = json.dumps({'version': VERSION, 'devices': devices}, separators=(',', ':')).encode()
+        except (TypeError, ValueError):
+            # A state which is not JSON serialisable (eg: an object set by an output) is left out of the snapshot
+            for name, state in list(devices.items()):
+                state['maps'] = [m for m in state['maps'] if self.serialisable((name, *m[:2]), m)]
+                if not self.serialisable((name,), state):
+                    del devices[name]
+            data = json.dumps({'version': VERSION, 'devices': devices}, separators=(',', ':')).encode()
+        if data == self.last:
+            return False
+        try:
+            write(self.path, data)
+        except OSError as e:
+            logging.warning(f'Snapshot {self.path} not written: {e}')
+            return False
+        self.last = data
+        return True
+
+    def serialisable(self, key, value):
+        """
+        Check that a device or mapping state can be written to the snapshot, warning once for each state which cannot
+
+        :param key: tuple of the device name, and the mode and name of the mapping
+        :param value: Captured state
+        :return: (bool) True if the state is JSON serialisable
+        """
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError) as e:
+            if key not in self.skipped:
+                self.skipped.add(key)
+                logging.warning(f'State of {"/".join(map(str, key))} left out of the snapshot: {e}')
+            return False
+        return True
+
+    def restore(self):
+        """
+        Restore the devices from the snapshot file, if there is one
+
+        :return: (bool) True if a snapshot was restored
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            snapshot = json.loads(data)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logging.warning(f'Snapshot {self.path} not restored: {e}')
+            return False
+        if snapshot.get('version') != VERSION:
+            return False
+
+        for device in self.devices:
+            state = snapshot['devices'].get(device.name)
+            if state is not None:
+                restored = apply(device, state)
+                logging.info(f'Device {device} restored {restored} mappings from {self.path}')
+        self.last = data
+        return True
+
+    def run(self):
+        """
+        Write snapshots until stopped. Runs in the snapshot thread
+        :return: None
+        """
+        while not self.stopped.wait(self.interval):
+            self.snapshot()
+
+    def start(self):
+        """
+        Start writing snapshots in the background
+        :return: self to allow method chaining
+        """
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name='snapshots', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop writing snapshots, writing a last one
+        :return: None
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.snapshot()
@@ -0,0 +1,192 @@
+import logging
+import asyncio
+import os
+import sys
+import subprocess
+import threading
+
+"""
+System notification service.
+
+Notifications are shown by a single background thread so the MIDI handling never waits for the desktop.
+A pending notification is replaced by a newer one with the same key (eg: the device), so rotating the mode browser
+shows the latest mode rather than a stack of notifications.
+
+"""
+
+
+class NullBackend:
+    """
+    Backend which does not show notifications, eg: for headless use
+    """
+    def show(self, key, subject, message):
+        pass
+
+
+class DBusBackend:
+    """
+    Freedesktop notifications using a persistent D-Bus session connection (requires dbus-python).
+    Notifications with the same key replace the one already displayed.
+    """
+    def __init__(self, app_name='midi2control', timeout=5000):
+        import dbus
+        bus = dbus.SessionBus()
+        self.interface = dbus.Interface(bus.get_object('org.freedesktop.Notifications',
+                                                       '/org/freedesktop/Notifications'),
+                                        'org.freedesktop.Notifications')
+        self.app_name = app_name
+        self.timeout = timeout
+        self.ids = dict()
+
+    def show(self, key, subject, message):
+        self.ids[key] = self.interface.Notify(self.app_name, self.ids.get(key, 0), '', subject, message,
+                                              [], {}, self.timeout)
+
+
+class NotifySendBackend:
+    """
+    Freedesktop notifications using the notify-send command
+    """
+    def show(self, key, subject, message):
+        subprocess.run(['notify-send', subject, message])
+
+
+class ToastBackend:
+    """
+    Windows 10 toast notifications (requires win10toast)
+    """
+    def __init__(self, duration=5):
+        from win10toast import ToastNotifier
+        self.toaster = ToastNotifier()
+        self.duration = duration
+
+    def show(self, key, subject, message):
+        self.toaster.show_toast(subject, message, duration=self.duration, threaded=False)
+
+
+class OsascriptBackend:
+    """
+    macOS notifications using AppleScript
+    """
+    def show(self, key, subject, message):
+        subprocess.run(['osascript', '-e', f'display notification "{message}" with title "{subject}"'])
+
+
+def default_backend():
+    """
+    Choose the notification backend for the current platform.
+    The environment variable MIDI2CONTROL_NOTIFY=none disables notifications.
+
+    :return: backend instance
+    """
+    if os.environ.get('MIDI2CONTROL_NOTIFY', '').lower() == 'none':
+        return NullBackend()
+    try:
+        if os.name == 'nt':
+            return ToastBackend()
+        elif sys.platform == 'darwin':
+            return OsascriptBackend()
+        elif os.name == 'posix':
+            if not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')):
+                return NullBackend()
+            try:
+                return DBusBackend()
+            except Exception as e:
+                logging.debug(f'D-Bus notifications unavailable ({e}), using notify-send')
+                return NotifySendBackend()
+    except Exception as e:
+        logging.warning(f'Notifications unavailable: {e}')
+    return NullBackend()
+
+
+class Notifier:
+    def __init__(self, backend=None):
+        """
+        Notification service showing notifications from a background thread
+
+        :param backend: Notification backend or None to choose the platform default when first used
+        """
+        self.backend = backend
+        self.pending = dict()  # Latest notification for each key, in order of arrival
+        self.condition = threading.Condition()
+        self.thread = None
+        self.loop = None  # asyncio event loop when served as a task with serve()
+        self.wakeup = None
+
+    def notify(self, subject, message, key=None):
+        """
+        Queue a notification without waiting for it to be shown
+
+        :param subject: (str) Notification title
+        :param message: (str) Notification text
+        :param key: Notifications with the same key replace each other (eg: the device name)
+        :return: None
+        """
+        with self.condition:
+            self.pending.pop(key, None)
+            self.pending[key] = (subject, message)
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.wakeup.set)
+            elif self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='notifications', daemon=True)
+                self.thread.start()
+            self.condition.notify()
+
+    def next(self):
+        """
+        Remove the oldest queued notification
+
+        :return: key, subject, message or None if nothing is queued
+        """
+        with self.condition:
+            if not self.pending:
+                return None
+            key = next(iter(self.pending))
+            return (key, ) + self.pending.pop(key)
+
+    def show(self, key, subject, message):
+        """
+        Show a notification using the backend
+        :return: None
+        """
+        if self.backend is None:
+            self.backend = default_backend()
+        try:
+            self.backend.show(key, subject, message)
+        except Exception as e:
+            logging.warning(f'Notification failed: {e}')
+
+    def run(self):
+        """
+        Show queued notifications. Runs in the notification thread
+        :return: None
+        """
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+            notification = self.next()
+            if notification:
+                self.show(*notification)
+
+    async def serve(self):
+        """
+        Show queued notifications as a task of the running asyncio event loop instead of the notification thread.
+        Backends are called in the loop default executor so they never block the loop.
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.loop = loop
+        if self.pending:
+            self.wakeup.set()
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                notification = self.next()
+                while notification:
+                    await loop.run_in_executor(None, self.show, *notification)
+                    notification = self.next()
+        finally:
+            self.loop = None
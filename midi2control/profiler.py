@@ -0,0 +1,185 @@
+import logging
+import json
+import socket
+import threading
+import time
+import weakref
+
+from midi2control.midi.breaker import output_name
+
+"""
+Lightweight profiling of mappings and outputs.
+
+Calls are counted per device and mapping class, mapping name or output function. Only one call in every `sample` calls is
+timed (CPU time of the calling thread and wall time), and the total time is estimated from the sampled calls, which
+keeps the overhead low enough to profile a live controller. Mapping times include the outputs they execute inline.
+
+    profiler = Profiler(sample=10).attach(ddj).serve()
+
+The statistics are served as JSON on a local TCP port, shown live by the top view:
+
+    python -m midi2control.top
+
+"""
+
+PORT = 7781  # Default local port of the statistics
+
+CALLS, SAMPLED, CPU, WALL = range(4)
+
+
+class Profiler:
+    def __init__(self, sample=10):
+        """
+        Call counts and sampled times of mappings and outputs
+
+        :param sample: (int) Time one in every sample calls of each mapping or output (1 to time every call)
+        """
+        self.sample = sample
+        self.stats = dict()  # [calls, sampled calls, cpu seconds, wall seconds] keyed by (kind, device name, name)
+        self.names = weakref.WeakKeyDictionary()  # Output names keyed by output function
+        self.started = time.time()
+        self.server = None
+
+    def entry(self, kind, device, name):
+        """
+        :param kind: (str) 'class', 'map' or 'output'
+        :param device: midi.device Device associated with the mapping, or None
+        :param name: (str) Name of the mapping class, mapping or output
+        :return: list of the statistics
+        """
+        key = (kind, getattr(device, 'name', ''), name)
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = self.stats[key] = [0, 0, 0.0, 0.0]
+        return entry
+
+    def message(self, mapping, device, msg):
+        """
+        Pass a message to a mapping, profiling the mapping and its class
+
+        :param mapping: midi.mapping MidiMap instance
+        :param device: midi.device Device associated with this mapping
+        :param msg: mido message received from the device
+        :return: None
+        """
+        by_map = self.entry('map', device, mapping.name)
+        by_class = self.entry('class', device, mapping.__class__.__name__)
+        by_map[CALLS] += 1
+        by_class[CALLS] += 1
+        if by_map[CALLS] % self.sample:
+            mapping.message(device, msg)
+            return
+        cpu, wall = time.thread_time(), time.perf_counter()
+        try:
+            mapping.message(device, msg)
+        finally:
+            cpu, wall = time.thread_time() - cpu, time.perf_counter() - wall
+            for entry in (by_map, by_class):
+                entry[SAMPLED] += 1
+                entry[CPU] += cpu
+                entry[WALL] += wall
+
+    def output(self, func, state, device=None, msg=None):
+        """
+        Execute an output function, profiling it
+
+        :param func: mapping output function
+        :param state: Object passed to the output as mapping
+        :param device: midi.device Device associated with the mapping
+        :param msg: mido message received from the device
+        :return: Result of the output function
+        """
+        try:
+            name = self.names.get(func)
+            if name is None:
+                name = self.names[func] = output_name(func)
+        except TypeError:  # Not weakly referenceable
+            name = output_name(func)
+        entry = self.entry('output', device, name)
+        entry[CALLS] += 1
+        if entry[CALLS] % self.sample:
+            return func(state, device, msg)
+        cpu, wall = time.thread_time(), time.perf_counter()
+        try:
+            return func(state, device, msg)
+        finally:
+            entry[SAMPLED] += 1
+            entry[CPU] += time.thread_time() - cpu
+            entry[WALL] += time.perf_counter() - wall
+
+    def report(self):
+        """
+        Statistics with the total times estimated from the sampled calls, hottest first
+
+        :return: list of dicts with kind, device, name, calls, cpu and wall (seconds)
+        """
+        rows = list()
+        for (kind, device, name), (calls, sampled, cpu, wall) in list(self.stats.items()):
+            scale = calls / sampled if sampled else 0
+            rows.append({'kind': kind, 'device': device, 'name': name, 'calls': calls, 'cpu': cpu * scale,
+                         'wall': wall * scale})
+        return sorted(rows, key=lambda row: row['wall'], reverse=True)
+
+    def reset(self):
+        """
+        Clear the statistics
+        :return: None
+        """
+        self.stats = dict()
+        self.started = time.time()
+
+    def attach(self, device):
+        """
+        Profile the mappings and outputs of a device
+
+        :param device: midi.device Device
+        :return: self to allow method chaining
+        """
+        device.profiler = self
+        return self
+
+    def detach(self, device):
+        """
+        Stop profiling a device
+
+        :param device: midi.device Device
+        :return: None
+        """
+        device.profiler = None
+
+    def serve(self, host='127.0.0.1', port=PORT):
+        """
+        Serve the report as JSON to each connection on a local TCP port, eg: for the midi2control.top view.
+        Runs in a background thread.
+
+        :param host: Address to listen on
+        :param port: (int) Port to listen on
+        :return: self to allow method chaining
+        """
+        self.server = socket.create_server((host, port))
+
+        def run():
+            while True:
+                try:
+                    connection, _ = self.server.accept()
+                except OSError:
+                    return  # Server closed
+                with connection:
+                    try:
+                        connection.sendall(json.dumps({'started': self.started,
+                                                       'report': self.report()}).encode())
+                    except OSError as e:
+                        logging.debug(f'Profile report not sent: {e}')
+
+        threading.Thread(target=run, name='profiler', daemon=True).start()
+        logging.info(f'Profiler serving on {host}:{port}')
+        return self
+
+    def close(self):
+        """
+        Stop serving the report
+        :return: None
+        """
+        if self.server is not None:
+            self.server.close()
+            self.server = None
@@ -0,0 +1,232 @@
+import argparse
+import contextlib
+import gc
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+
+from midi2control import set_notification_backend
+from midi2control.notify import NullBackend
+from midi2control.control import output
+from midi2control.midi.device import flatten
+from midi2control.midi.mapping import map_copy
+from midi2control.midi.memory import MemoryPort
+from midi2control.midi.pioneer.pioneer import JogDial, Browser, Slide, Press
+from midi2control.midi.pioneer import ddj_sb
+
+"""
+Soak test driving a fully configured DDJ-SB through an in memory port.
+
+Millions of mixed messages (buttons, jog dials, faders) and repeated mode changes are fed in batches. For each window
+of messages the handling latency percentiles, outputs executed, RSS, traced Python memory and thread count are
+reported. The run fails if a window executed no outputs or if any of the measurements drift beyond the thresholds
+between the first window after warm up and the last window, and the allocations which grew the most are shown.
+
+    python -m midi2control.soak --messages 1000000
+
+"""
+
+
+def gestures(device):
+    """
+    Message bytes a controller sends for the controls of the default mode (except the mode selector)
+
+    :param device: midi.device Device
+    :return: list of lists of message bytes, each a complete gesture (eg: a coarse and fine fader value)
+    """
+    result = list()
+    for m in device.midi_maps[None].values():
+        if m.name.startswith('BROWSE:'):
+            continue
+        channels = list(flatten(m.channel))
+        if isinstance(m, Press):
+            for channel in channels:
+                for note in flatten(m.note):
+                    result.append([bytes((0x90 | channel, note, 127))])
+                    result.append([bytes((0x90 | channel, note, 0))])
+        elif isinstance(m, Slide):
+            for channel in channels:
+                for coarse, fine in zip(m.coarse_control, m.fine_control):
+                    for value in (0, 37, 64, 101, 127):
+                        result.append([bytes((0xB0 | channel, coarse, value)), bytes((0xB0 | channel, fine, 0))])
+        elif isinstance(m, (JogDial, Browser)):
+            for channel in channels:
+                for control in flatten(m.control):
+                    result.append([bytes((0xB0 | channel, control, 65))])
+                    result.append([bytes((0xB0 | channel, control, 63))])
+    return result
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def rss():
+    """
+    :return: Resident memory of the process in MB, or None if unknown
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2 ** 20
+    except ImportError:
+        return None
+
+
+def soak(messages=1000000, batch=16, window=100000, mode_every=5000, trace=True, seed=0, warmup=1, report=None):
+    """
+    Drive a DDJ-SB with a default and a second mode through an in memory port
+
+    :param messages: (int) Number of messages to feed
+    :param batch: (int) Messages fed before each check_inputs()
+    :param window: (int) Messages per measurement window
+    :param mode_every: (int) Messages between mode changes (using the mode selector)
+    :param trace: (bool) Trace Python allocations with tracemalloc (slower)
+    :param seed: Random seed of the message mix
+    :param warmup: (int) Number of windows ignored as warm up
+    :param report: function called with a line of text for each window (defaults to printing it)
+    :return: list of dicts with the measurements of each window,
+    and tracemalloc snapshots (first window after warm up, last window) or None
+    """
+    stdout = sys.stdout
+    report = report or (lambda line: print(line, file=stdout, flush=True))
+    set_notification_backend(NullBackend())
+    rng = random.Random(seed)
+    port = MemoryPort('PIONEER DDJ-SB:PIONEER')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        device = ddj_sb.DDJ_SB(ports=(port, port))
+        device.add_maps({'Gaming': map_copy(ddj_sb.MODE_SELECTOR) + map_copy(ddj_sb.DECK1) + map_copy(ddj_sb.MIXER)})
+        device.finish_sync()
+
+        handled = [0]
+
+        def count(mapping, device=None, msg=None):
+            handled[0] += 1
+
+        for maps in device.midi_maps.values():
+            for m in maps.values():
+                if count not in m.outputs:
+                    m.add_output(count, initialise=False)
+        browser = device.get_map('BROWSE:ROTATE')
+        browser.add_output(device.browse_mode, initialise=False)
+        device.get_map('BROWSE:PRESS').add_output(output(device.change_mode, mode_index=browser), initialise=False)
+
+        pool = gestures(device)
+        mode_change = [bytes((0xB6, 64, 1)), bytes((0x96, 65, 127)), bytes((0x96, 65, 0))]
+
+        if trace:
+            tracemalloc.start()
+        windows = list()
+        snapshots = None
+        latencies = list()
+        fed = 0
+        counted = 0  # Outputs executed before the current window
+        next_mode = mode_every
+        next_window = window
+        started = time.perf_counter()
+        while fed < messages:
+            count_batch = 0
+            while count_batch < batch:
+                if fed + count_batch >= next_mode:
+                    frames = mode_change
+                    next_mode += mode_every
+                else:
+                    frames = rng.choice(pool)
+                for frame in frames:
+                    port.feed(frame)
+                count_batch += len(frames)
+            start = time.perf_counter()
+            device.check_inputs()
+            latencies.append(time.perf_counter() - start)
+            fed += count_batch
+
+            if fed >= next_window or fed >= messages:
+                next_window += window
+                gc.collect()
+                latencies.sort()
+                elapsed = time.perf_counter() - started
+                measurement = {'messages': fed, 'rate': fed / elapsed, 'handled': handled[0] - counted,
+                               'p50': percentile(latencies, 0.5), 'p99': percentile(latencies, 0.99),
+                               'rss': rss(), 'traced': tracemalloc.get_traced_memory()[0] / 2 ** 20 if trace else None,
+                               'threads': threading.active_count(), 'mode': device.mode}
+                windows.append(measurement)
+                if trace:
+                    # Compare the last window with the first window after warm up
+                    snapshot = tracemalloc.take_snapshot()
+                    snapshots = (snapshot, snapshot) if len(windows) <= warmup + 1 else (snapshots[0], snapshot)
+                counted = handled[0]
+                report(f'{fed:>10} msgs {measurement["rate"]:>9.0f}/s  outputs {measurement["handled"]:>8}  '
+                       f'p50 {measurement["p50"] * 1e6:>7.1f} us  p99 {measurement["p99"] * 1e6:>7.1f} us  rss {measurement["rss"] or 0:>7.1f} MB  '
+                       f'traced {measurement["traced"] or 0:>6.2f} MB  threads {measurement["threads"]:>3}')
+                latencies = list()
+        if trace:
+            tracemalloc.stop()
+    return windows, snapshots
+
+
+def drift(windows, warmup=1, max_rss=20.0, max_traced=5.0, max_threads=4, max_latency=2.0):
+    """
+    Check that every window executed outputs, and the measurements of the last window against the first window
+    after warm up
+
+    :param windows: list of window measurements returned by soak()
+    :param warmup: (int) Number of windows ignored as warm up
+    :param max_rss: Maximum RSS growth in MB
+    :param max_traced: Maximum traced Python memory growth in MB
+    :param max_threads: (int) Maximum thread count growth
+    :param max_latency: Maximum ratio of the p99 latency
+    :return: list of failure descriptions (empty if the run passed)
+    """
+    failures = [f'No outputs executed in the window ending at {w["messages"]} messages'
+                for w in windows if not w['handled']]
+    if len(windows) <= warmup:
+        return failures
+    first, last = windows[warmup], windows[-1]
+    if first['rss'] is not None and last['rss'] - first['rss'] > max_rss:
+        failures.append(f'RSS grew {last["rss"] - first["rss"]:.1f} MB (max {max_rss} MB)')
+    if first['traced'] is not None and last['traced'] - first['traced'] > max_traced:
+        failures.append(f'Traced memory grew {last["traced"] - first["traced"]:.2f} MB (max {max_traced} MB)')
+    if last['threads'] - first['threads'] > max_threads:
+        failures.append(f'Threads grew from {first["threads"]} to {last["threads"]} (max {max_threads} more)')
+    if first['p99'] and last['p99'] / first['p99'] > max_latency:
+        failures.append(f'p99 latency grew {last["p99"] / first["p99"]:.1f} times '
+                        f'({first["p99"] * 1e6:.1f} to {last["p99"] * 1e6:.1f} us, max {max_latency} times)')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Soak test of a DDJ-SB driven through an in memory port')
+    parser.add_argument('--messages', type=int, default=1000000, help='Number of messages')
+    parser.add_argument('--batch', type=int, default=16, help='Messages per check_inputs()')
+    parser.add_argument('--window', type=int, default=100000, help='Messages per measurement window')
+    parser.add_argument('--mode-every', type=int, default=5000, help='Messages between mode changes')
+    parser.add_argument('--no-trace', action='store_true', help='Do not trace allocations (faster)')
+    parser.add_argument('--max-rss', type=float, default=20.0, help='Maximum RSS growth (MB)')
+    parser.add_argument('--max-traced', type=float, default=5.0, help='Maximum traced memory growth (MB)')
+    parser.add_argument('--max-threads', type=int, default=4, help='Maximum thread count growth')
+    parser.add_argument('--max-latency', type=float, default=2.0, help='Maximum p99 latency growth (ratio)')
+    args = parser.parse_args()
+
+    windows, snapshots = soak(args.messages, args.batch, args.window, args.mode_every, trace=not args.no_trace)
+    if snapshots is not None and len(snapshots) == 2:
+        print('\nLargest allocation growth:')
+        for stat in snapshots[1].compare_to(snapshots[0], 'lineno')[:10]:
+            print(f'  {stat}')
+    failures = drift(windows, max_rss=args.max_rss, max_traced=args.max_traced, max_threads=args.max_threads,
+                     max_latency=args.max_latency)
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    if failures:
+        raise SystemExit(1)
+    print('PASS')
+
+
+if __name__ == '__main__':
+    main()
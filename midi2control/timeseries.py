@@ -0,0 +1,252 @@
+import logging
+import json
+import math
+import struct
+import threading
+from collections import deque
+
+from midi2control.clock import CLOCK
+from midi2control.metrics import STATE_LOG_DROPS
+
+"""
+Columnar time series of the mapping states, for later analysis.
+
+Every state a mapping outputs is recorded as (time, device, mode, mapping name, value). Recording appends a tuple to
+a bounded buffer, cheap enough to leave on during live sessions. A background thread writes the buffered rows in
+batches, so the input handling never waits for the disk. If the writer falls behind, rows are dropped (and counted)
+rather than growing the memory.
+
+    log = StateLog('session.npy').attach(ddj).start()
+    ddj.monitor_inputs()
+    log.close()
+
+A .npy file is a NumPy record array readable without any conversion (device, mode and name are stored as codes, the
+names are in a .json file next to it). load() returns the columns, eg: pandas.DataFrame(load('session.npy')).
+With pyarrow installed, .arrow (Arrow IPC) and .parquet files can be written instead.
+
+"""
+
+NPY_HEADER = 256  # Bytes reserved for the .npy header, rewritten with the number of rows after each batch
+NPY_DESCR = [('time', '<f8'), ('device', '<u2'), ('mode', '<u2'), ('name', '<u2'), ('value', '<f8')]
+NPY_ROW = struct.Struct('<dHHHd')
+CATEGORIES = ('device', 'mode', 'name')
+
+
+def value(state):
+    """
+    :param state: Mapping state
+    :return: (float) Numeric value of the state, NaN if it has none (eg: None)
+    """
+    try:
+        return float(state)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class NpyWriter:
+    def __init__(self, path):
+        """
+        Writes rows to a .npy record array, valid after every batch
+
+        :param path: Path of the .npy file (the category names are written to path + '.json')
+        """
+        self.path = str(path)
+        self.file = open(self.path, 'wb')
+        self.rows = 0
+        self.codes = {category: dict() for category in CATEGORIES}  # Code of each name, keyed by name
+        self.write_header()
+
+    def write_header(self):
+        header = repr({'descr': NPY_DESCR, 'fortran_order': False, 'shape': (self.rows, )})
+        header = header.ljust(NPY_HEADER - 10 - 1) + '\n'
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1'))
+
+    def code(self, category, name):
+        codes = self.codes[category]
+        if name not in codes:
+            codes[name] = len(codes)
+        return codes[name]
+
+    def write(self, rows):
+        """
+        :param rows: list of (time, device, mode, mapping name, state)
+        :return: None
+        """
+        code = self.code
+        data = b''.join(NPY_ROW.pack(time, code('device', device), code('mode', mode), code('name', name),
+                                     value(state)) for time, device, mode, name, state in rows)
+        self.file.seek(NPY_HEADER + self.rows * NPY_ROW.size)
+        self.file.write(data)
+        self.rows += len(rows)
+        self.write_header()
+        self.file.flush()
+        with open(self.path + '.json', 'w') as f:
+            json.dump({category: list(codes) for category, codes in self.codes.items()}, f)
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter:
+    def __init__(self, path):
+        """
+        Writes rows to an Arrow IPC (.arrow) or Parquet (.parquet) file, one record batch or row group per batch.
+        A Parquet file is only readable once closed.
+
+        :param path: Path of the file
+        """
+        import pyarrow
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([('time', pyarrow.float64()), ('device', pyarrow.string()),
+                                      ('mode', pyarrow.string()), ('name', pyarrow.string()),
+                                      ('value', pyarrow.float64())])
+        if str(path).endswith('.parquet'):
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(str(path), self.schema)
+        else:
+            import pyarrow.ipc
+            self.writer = pyarrow.ipc.new_file(str(path), self.schema)
+
+    def write(self, rows):
+        """
+        :param rows: list of (time, device, mode, mapping name, state)
+        :return: None
+        """
+        time, device, mode, name, state = zip(*rows)
+        columns = (time, device, tuple(None if m is None else str(m) for m in mode), name, map(value, state))
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(list(column), type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def writer(path):
+    """
+    :param path: Path of the file, the suffix selects the format: .npy (default), .arrow or .parquet
+    :return: NpyWriter or ArrowWriter
+    """
+    return ArrowWriter(path) if str(path).endswith(('.arrow', '.parquet')) else NpyWriter(path)
+
+
+def load(path):
+    """
+    Read a .npy state log (requires numpy)
+
+    :param path: Path of the .npy file
+    :return: dict of numpy arrays keyed by column: time, device, mode, name and value
+    """
+    import numpy
+    records = numpy.load(str(path))
+    with open(str(path) + '.json') as f:
+        categories = json.load(f)
+    columns = {column: records[column] for column in records.dtype.names}
+    for category in CATEGORIES:
+        columns[category] = numpy.array(categories[category], dtype=object)[records[category]]
+    return columns
+
+
+class StateLog:
+    def __init__(self, path, capacity=100000, interval=1.0, clock=None):
+        """
+        Time series of the states output by the mappings of devices, see attach()
+
+        :param path: Path of the file, the suffix selects the format: .npy (default), .arrow or .parquet
+        :param capacity: (int) Maximum rows buffered, further rows are dropped until the writer catches up
+        :param interval: Seconds between writes (earlier once a quarter of the capacity is buffered)
+        :param clock: midi2control.clock Clock of the timestamps (defaults to the wall clock)
+        """
+        self.path = path
+        self.capacity = capacity
+        self.interval = interval
+        self.clock = clock or CLOCK
+        self.batch = max(1, capacity // 4)
+        self.rows = deque()  # Rows recorded and not yet written
+        self.drops = STATE_LOG_DROPS.labels(str(path))
+        self.writer = writer(path)
+        self.lock = threading.Lock()  # Held while writing
+        self.wake = threading.Event()
+        self.thread = None
+        self.closed = False
+
+    def record(self, mapping, device=None):
+        """
+        Record the current state of a mapping
+
+        :param mapping: midi.mapping MidiMap instance
+        :param device: midi.device Device associated with the mapping
+        :return: None
+        """
+        rows = self.rows
+        if len(rows) >= self.capacity:
+            self.drops.inc()
+            return
+        rows.append((self.clock.time(), device.name if device is not None else '', getattr(device, 'mode', None),
+                     mapping.name, mapping.current_state))
+        if len(rows) == self.batch:
+            self.wake.set()
+
+    def attach(self, device):
+        """
+        Record the states of the mappings of a device
+
+        :param device: midi.device Device
+        :return: self to allow method chaining
+        """
+        device.state_log = self
+        return self
+
+    def detach(self, device):
+        """
+        Stop recording a device
+
+        :param device: midi.device Device
+        :return: None
+        """
+        device.state_log = None
+
+    def flush(self):
+        """
+        Write the buffered rows
+        :return: (int) Number of rows written
+        """
+        with self.lock:
+            rows = self.rows
+            batch = [rows.popleft() for _ in range(len(rows))]
+            if batch:
+                self.writer.write(batch)
+            return len(batch)
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f'State log {self.path} not written: {e!r}')
+
+    def start(self):
+        """
+        Write the rows in a background thread
+        :return: self to allow method chaining
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='state log', daemon=True)
+            self.thread.start()
+        return self
+
+    def close(self):
+        """
+        Write the remaining rows and close the file
+        :return: None
+        """
+        self.closed = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        self.writer.close()
+        logging.info(f'State log {self.path} closed')
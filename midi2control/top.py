@@ -0,0 +1,90 @@
+import argparse
+import json
+import socket
+import time
+
+from midi2control.profiler import PORT
+
+"""
+Live view of the hottest mappings and outputs of a running process profiled with midi2control.profiler Profiler:
+
+    python -m midi2control.top [--port 7781] [--interval 1] [--limit 20]
+
+"""
+
+
+def fetch(host='127.0.0.1', port=PORT, timeout=2):
+    """
+    Read the profile report of a running process
+
+    :param host: Address of the profiler
+    :param port: (int) Port of the profiler
+    :param timeout: Seconds to wait for the report
+    :return: dict with started (time) and report (list of rows)
+    """
+    with socket.create_connection((host, port), timeout=timeout) as connection:
+        chunks = list()
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks))
+
+
+def render(data, previous=None, limit=20):
+    """
+    Format the report as a table, with call rates since the previous report
+
+    :param data: dict returned by fetch()
+    :param previous: (tuple) time and dict returned by fetch() of the previous refresh, or None
+    :param limit: (int) Maximum number of rows
+    :return: (str) table
+    """
+    rates = dict()
+    if previous is not None:
+        elapsed = time.time() - previous[0]
+        before = {(row['kind'], row.get('device'), row['name']): row['calls'] for row in previous[1]['report']}
+        for row in data['report']:
+            key = (row['kind'], row.get('device'), row['name'])
+            rates[key] = (row['calls'] - before.get(key, 0)) / elapsed if elapsed > 0 else 0
+
+    lines = [f'midi2control top - profiling for {time.time() - data["started"]:.0f} seconds', '',
+             f'{"KIND":<7} {"CALLS":>10} {"CALLS/S":>9} {"CPU MS":>10} {"WALL MS":>10} {"US/CALL":>9}  '
+             f'{"DEVICE":<16} NAME']
+    for row in data['report'][:limit]:
+        per_call = row['wall'] / row['calls'] * 1e6 if row['calls'] else 0
+        rate = rates.get((row['kind'], row.get('device'), row['name']), 0)
+        lines.append(f'{row["kind"]:<7} {row["calls"]:>10} {rate:>9.1f} {row["cpu"] * 1000:>10.1f} '
+                     f'{row["wall"] * 1000:>10.1f} {per_call:>9.1f}  {row.get("device") or "-":<16.16} {row["name"]}')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Live view of the hottest mappings and outputs of midi2control')
+    parser.add_argument('--host', default='127.0.0.1', help='Address of the profiler')
+    parser.add_argument('--port', type=int, default=PORT, help='Port of the profiler')
+    parser.add_argument('--interval', type=float, default=1, help='Seconds between refreshes')
+    parser.add_argument('--limit', type=int, default=20, help='Number of rows shown')
+    parser.add_argument('--once', action='store_true', help='Show the report once and exit')
+    args = parser.parse_args()
+
+    previous = None
+    while True:
+        data = fetch(args.host, args.port)
+        table = render(data, previous, args.limit)
+        if args.once:
+            print(table)
+            return
+        print('\033[2J\033[H' + table, flush=True)
+        previous = (time.time(), data)
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except ConnectionRefusedError:
+        print('No profiler found. Start one in the process with Profiler().attach(device).serve()')
@@ -0,0 +1,98 @@
+import asyncio
+import gc
+import unittest
+
+from midi2control import set_notification_backend
+from midi2control.notify import NullBackend
+from midi2control.clock import VirtualClock
+from midi2control.midi.breaker import Breakers, CLOSED, OPEN, output_name
+from midi2control.midi.device import Device
+from midi2control.midi.memory import MemoryPort
+from midi2control.midi.pioneer.pioneer import Press
+
+"""
+Circuit breakers of the outputs and names of the outputs in the metrics and profiles, see midi.breaker
+
+"""
+
+
+def factory(value):
+    def func(mapping, device=None, msg=None):
+        return value
+    return func
+
+
+class Light:
+    def set_brightness(self, mapping, device=None, msg=None):
+        pass
+
+
+class OutputNameTest(unittest.TestCase):
+    def test_alike_outputs_numbered(self):
+        first, second = factory('x'), factory('x')
+        label = output_name(first)
+        self.assertEqual(output_name(second), label + '#2')
+        self.assertEqual(output_name(first), output_name(first))
+
+    def test_replaced_outputs_keep_names(self):
+        """Outputs recreated on reload take the names (metric series) of the collected ones"""
+        outputs = [factory('y'), factory('y')]
+        names = [output_name(func) for func in outputs]
+        del outputs
+        gc.collect()
+        outputs = [factory('y'), factory('y')]
+        self.assertEqual([output_name(func) for func in outputs], names)
+
+    def test_bound_methods(self):
+        light = Light()
+        outputs = [light.set_brightness]
+        self.assertEqual(output_name(light.set_brightness), output_name(outputs[0]))
+        self.assertNotIn('#', output_name(outputs[0]))
+
+
+class AsyncOutputBreakerTest(unittest.TestCase):
+    def setUp(self):
+        set_notification_backend(NullBackend())
+        self.failing = False
+        self.calls = 0
+
+        async def output(mapping, device=None, msg=None):
+            self.calls += 1
+            if self.failing:
+                raise OSError('unreachable')
+
+        self.output = output
+        self.port = MemoryPort('test')
+        self.clock = VirtualClock()
+        self.device = Device('test', ports=(self.port, self.port), clock=self.clock,
+                             midi_maps={None: [Press('a', channel=0, note=1, outputs=[output])]})
+        self.device.breakers = Breakers(threshold=2, backoff=10, clock=self.clock)
+        self.device.finish_sync()
+        self.failing = True
+        self.calls = 0
+
+    def press(self, times):
+        async def run():
+            for _ in range(times):
+                for velocity in (127, 0):  # Press and release, each triggering the output
+                    self.port.feed(bytes((0x90, 1, velocity)))
+                    self.device.check_inputs()
+                    await asyncio.sleep(0)  # Let the output task complete
+                    await asyncio.sleep(0)
+        asyncio.run(run())
+
+    def test_async_failures_open_breaker(self):
+        self.press(2)
+        self.assertEqual(self.device.breakers.get(self.output).state, OPEN)
+        self.assertEqual(self.calls, 2)  # Skipped once open
+
+    def test_async_probe_closes_breaker(self):
+        self.press(1)
+        self.failing = False
+        self.clock.advance(10)
+        breaker = self.device.breakers.get(self.output)
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
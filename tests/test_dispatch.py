@@ -0,0 +1,55 @@
+import unittest
+
+from midi2control import set_notification_backend
+from midi2control.notify import NullBackend
+from midi2control.midi.device import Device
+from midi2control.midi.memory import MemoryPort
+from midi2control.midi.pioneer.pioneer import Press
+
+"""
+Dispatch of batches of messages, see Device.dispatch_batch()
+
+"""
+
+
+class ModeChangeInBatchTest(unittest.TestCase):
+    def setUp(self):
+        set_notification_backend(NullBackend())
+        self.calls = list()
+
+        def record(label):
+            def func(mapping, device=None, msg=None):
+                self.calls.append((label, mapping.current_state))
+            return func
+
+        def switch(mapping, device=None, msg=None):
+            if mapping.current_state:
+                device.change_mode('M2')
+
+        self.port = MemoryPort('test')
+        self.device = Device('test', ports=(self.port, self.port), midi_maps={
+            None: [Press('a', channel=0, note=1, outputs=[record('a-old'), switch]),
+                   Press('b', channel=0, note=2, outputs=[record('b-old')])],
+            'M2': [Press('b', channel=0, note=2, outputs=[record('b-new')])]})
+        self.device.finish_sync()
+        self.calls.clear()
+
+    def feed(self, *frames):
+        for frame in frames:
+            self.port.feed(bytes(frame))
+        self.device.check_inputs()
+
+    def test_message_handled_in_one_mode(self):
+        self.feed((0x90, 1, 0), (0x90, 1, 127), (0x90, 2, 127))
+        self.assertEqual(self.device.mode, 'M2')
+        self.assertIn(('a-old', True), self.calls)
+        self.assertEqual(len([label for label, _ in self.calls if label.startswith('b-')]), 1)
+
+    def test_message_after_mode_change_routed_to_new_mode(self):
+        self.feed((0x90, 1, 127), (0x90, 1, 0), (0x90, 2, 127), (0x90, 2, 0))
+        self.assertEqual(self.device.mode, 'M2')
+        self.assertEqual([c for c in self.calls if c[0].startswith('b-')], [('b-new', True), ('b-new', False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
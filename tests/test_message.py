@@ -0,0 +1,28 @@
+import unittest
+
+from midi2control.midi.message import RawMessage
+
+"""
+Raw channel messages, see midi.message RawMessage
+
+"""
+
+
+class RawMessageEqualityTest(unittest.TestCase):
+    def setUp(self):
+        self.msg = RawMessage(b'\x90\x05\x7f')
+
+    def test_equal_messages_and_bytes(self):
+        self.assertEqual(self.msg, RawMessage(b'\x90\x05\x7f'))
+        self.assertEqual(self.msg, b'\x90\x05\x7f')
+        self.assertEqual(self.msg, bytearray(b'\x90\x05\x7f'))
+        self.assertNotEqual(self.msg, b'\x90\x05\x00')
+
+    def test_other_objects_not_equal(self):
+        for other in (None, 'note_on', 5):
+            self.assertNotEqual(self.msg, other)
+        self.assertNotIn(self.msg, [None, 'note_on'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from midi2control import set_notification_backend
+from midi2control.notify import NullBackend
+from midi2control.midi.device import Device
+from midi2control.midi.memory import MemoryPort
+from midi2control.midi.pioneer.pioneer import Press
+from midi2control.midi.reload import ConfigWatcher
+
+"""
+Reloading of mapping configurations, see Device.reload() and midi.reload ConfigWatcher
+
+"""
+
+CONFIG = '''
+from midi2control.midi.pioneer.pioneer import Press
+calls = resource('calls', list)
+
+def record(label):
+    def func(mapping, device=None, msg=None):
+        calls.append((label, mapping.current_state))
+    return func
+
+kept = Press('KEPT', channel=0, note=1, toggle=True, outputs=[record('kept')])
+changed = Press('CHANGED', channel=0, note=2, toggle=True, outputs=[record('{changed}')])
+added = Press('ADDED', channel=0, note=3, outputs=[record('added')])
+quiet = Press('QUIET', channel=0, note=4)
+quiet.add_output(record('quiet'), initialise=False)
+other = Press('OTHER', channel=0, note=5, outputs=[record('other')])
+MIDI_MAPS = {{None: [kept, changed, added, quiet], 'M2': [other]}}
+'''
+
+
+class ReloadTest(unittest.TestCase):
+    def setUp(self):
+        set_notification_backend(NullBackend())
+        self.calls = list()
+        self.port = MemoryPort('test')
+        self.device = Device('test', ports=(self.port, self.port), midi_maps={
+            None: [Press('KEPT', channel=0, note=1, toggle=True), Press('CHANGED', channel=0, note=2, toggle=True)]})
+        self.device.finish_sync()
+        self.path = os.path.join(tempfile.mkdtemp(), 'config.py')
+        self.watcher = ConfigWatcher(self.device, self.path)
+        self.watcher.resources['calls'] = self.calls
+
+    def load(self, changed):
+        with open(self.path, 'w') as f:
+            f.write(CONFIG.format(changed=changed))
+        self.watcher.load()
+        self.device.apply_reload()
+
+    def test_only_added_and_changed_outputs_initialised(self):
+        self.load('changed')
+        for note in (1, 2):  # Toggle KEPT and CHANGED on
+            self.port.feed(bytes((0x90, note, 127)))
+        self.device.check_inputs()
+        self.calls.clear()
+
+        self.load('changed again')
+        self.assertEqual(self.calls, [('changed again', True)])
+        self.assertTrue(self.device.get_map('KEPT').current_state)
+
+    def test_new_mappings_of_current_mode_initialised(self):
+        self.load('changed')
+        self.assertIn(('added', False), self.calls)
+        self.assertNotIn('quiet', [label for label, _ in self.calls])
+        self.assertNotIn('other', [label for label, _ in self.calls])
+
+
+if __name__ == '__main__':
+    unittest.main()